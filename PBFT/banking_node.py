@@ -1,24 +1,27 @@
 from shared.banking_service import BankingService
 from shared.pbft_utils import send_to_node
+from shared.session_table import InvalidRequest, SessionTable, request_key
+from shared.vote_store import VoteStore
 import json
 
 
 class BankingNode:
-    def __init__(self, node_id, total_nodes, db_name):
+    def __init__(self, node_id, total_nodes, db_name, vote_horizon=300):
         self.node_id = node_id
         self.total_nodes = total_nodes
         self.state = "NONE"
         self.view = -1
         self.db_name = db_name
-        self.commit_count = {}
-        self.executed_transactions = set()
+        # Commit votes per transaction, released on execution and evicted after vote_horizon seconds
+        self.commit_count = VoteStore(vote_horizon)
+        # Executed requests and replies per client, so retransmissions are never executed twice
+        self.session_table = SessionTable()
         self.banking_service = BankingService(db_name)
 
     def handle_request(self, message):
         """
         Handles incoming PBFT messages based on their action type and processes banking transactions.
         """
-        global commit_count, executed_transactions
         action = message.get("action")
         transaction = message.get("transaction")
 
@@ -28,6 +31,16 @@ class BankingNode:
 
         print(f"[DEBUG] Current state: {self.state}, Received action: {action}")
 
+        try:
+            key = request_key(transaction)
+        except InvalidRequest as e:
+            print(f"[ERROR] Invalid request: {e}. Ignoring.")
+            return
+        executed, reply = self.session_table.lookup(*key) if key is not None else (False, None)
+        if executed:
+            print(f"[DEBUG] Request {key} already executed. Answering from the session table.")
+            return reply
+
         if action == "pre-prepare" and self.state == "NONE":
             print(f"[DEBUG] Received pre-prepare, broadcasting to replicas...")
             self.state = "PRE_PREPARE_SENT"
@@ -40,7 +53,7 @@ class BankingNode:
 
         elif action == "commit" and self.state == "PREPARE_SENT":
             print(f"[DEBUG] Received commit, processing transaction...")
-            self.process_commit(transaction)
+            return self.process_commit(transaction)
 
         else:
             print(f"[WARNING] Unknown or invalid action: {action}, Current state: {self.state}")
@@ -56,38 +69,60 @@ class BankingNode:
     def process_commit(self, transaction):
         """
         Process the commit and execute the transaction if a quorum is reached.
+        Returns the reply for the client once the transaction is executed.
         """
-        transaction_id = hash(json.dumps(transaction, sort_keys=True))  # Unique transaction ID
-
-        if transaction_id in self.executed_transactions:
-            print(f"[DEBUG] Transaction {transaction_id} already executed. Skipping.")
-            return
+        key = request_key(transaction)
+        executed, reply = self.session_table.lookup(*key) if key is not None else (False, None)
+        if executed:
+            print(f"[DEBUG] Request {key} already executed. Answering from the session table.")
+            return reply
 
-        # Initialize commit count for this transaction if not already done
-        if transaction_id not in self.commit_count:
-            self.commit_count[transaction_id] = set()
+        # Requests from clients without ids fall back to their canonical JSON form
+        transaction_id = key if key is not None else json.dumps(transaction, sort_keys=True)
 
         # Add the node ID to the set of commits for this transaction
-        self.commit_count[transaction_id].add(self.node_id)
+        commits = self.commit_count.add(transaction_id, self.node_id)
 
         # Check if quorum is reached
-        if len(self.commit_count[transaction_id]) >= 2 * (self.total_nodes // 3) + 1:  # Adjust based on configuration
+        if commits >= 2 * (self.total_nodes // 3) + 1:  # Adjust based on configuration
+            # Only the caller that claims the request executes it
+            if key is not None:
+                claimed, reply = self.session_table.begin(*key)
+                if not claimed:
+                    print(f"[DEBUG] Request {key} already executed or being executed. Answering from the session table.")
+                    return reply
+
             print(f"[DEBUG] Quorum reached for transaction: {transaction}")
             print("[DEBUG] Executing transaction...")
 
             # Execute the transaction
-            transaction_type = transaction.get("type")
-            if transaction_type == "create_account":
-                self.banking_service.create_account(transaction.get("name"), transaction.get("balance"))
-            elif transaction_type == "deposit":
-                self.banking_service.deposit(transaction.get("name"), transaction.get("amount"))
-            elif transaction_type == "withdraw":
-                self.banking_service.withdraw(transaction.get("name"), transaction.get("amount"))
-            else:
-                print(f"[WARNING] Unknown transaction type: {transaction_type}")
-
-            # Mark the transaction as executed
-            self.executed_transactions.add(transaction_id)
+            try:
+                transaction_type = transaction.get("type")
+                if transaction_type == "create_account":
+                    self.banking_service.create_account(transaction.get("name"), transaction.get("balance"))
+                elif transaction_type == "deposit":
+                    self.banking_service.deposit(transaction.get("name"), transaction.get("amount"))
+                elif transaction_type == "withdraw":
+                    self.banking_service.withdraw(transaction.get("name"), transaction.get("amount"))
+                else:
+                    print(f"[WARNING] Unknown transaction type: {transaction_type}")
+            except Exception:
+                if key is not None:
+                    self.session_table.abort(*key)
+                raise
+
+            reply = {
+                "client_id": transaction.get("client_id"),
+                "request_seq": transaction.get("request_seq"),
+                "status": "executed",
+                "balance": self.banking_service.get_balance(transaction.get("name"))
+            }
+            # The votes are no longer needed once the request is executed
+            self.commit_count.release(transaction_id)
+            if key is not None:
+                self.session_table.record(*key, reply)
+                self.session_table.collect_garbage()
+            return reply
 
         else:
             print(f"[DEBUG] Waiting for more commits for transaction {transaction_id}.")
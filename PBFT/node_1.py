@@ -1,21 +1,51 @@
+import itertools
 import json
+import time
 from shared.pbft_utils import send_to_node, start_listener
 from shared.banking_service import BankingService
+from shared.session_table import SessionTable, request_key
+from shared.vote_store import VoteStore
 import threading
 
 node_id = 1
 total_nodes = 3
 db_name = f"databases/banking_node_{node_id}.db"
 banking_service = BankingService(db_name)
-commit_count = {}
-executed_transactions = set()
+# Commit votes per transaction, released on execution and evicted after vote_horizon seconds
+vote_horizon = 300
+commit_count = VoteStore(vote_horizon)
+# Executed requests and replies per client, so retransmissions are never executed twice
+session_table = SessionTable()
+# Requests from this node's menu are identified by (client_id, request_seq)
+client_id = f"node-{node_id}"
+request_seq = itertools.count(int(time.time() * 1000))  # Starts past the sequence numbers of earlier runs
 f = (total_nodes - 1) // 3
 
+def execute_transaction(transaction):
+    """
+    Execute a committed transaction and build the reply for its client.
+    """
+    transaction_type = transaction.get("type")
+    if transaction_type == "create_account":
+        banking_service.create_account(transaction.get("name"), transaction.get("balance"))
+    elif transaction_type == "deposit":
+        banking_service.deposit(transaction.get("name"), transaction.get("amount"))
+    elif transaction_type == "withdraw":
+        banking_service.withdraw(transaction.get("name"), transaction.get("amount"))
+    else:
+        print(f"[WARNING] Unknown transaction type: {transaction_type}")
+    return {
+        "client_id": transaction.get("client_id"),
+        "request_seq": transaction.get("request_seq"),
+        "status": "executed",
+        "balance": banking_service.get_balance(transaction.get("name"))
+    }
+
 def handle_request(message, db_name):
     """
     Handles incoming PBFT messages based on their action type.
     """
-    global commit_count, executed_transactions, f
+    global commit_count, f
     action = message.get("action")
     if not action:
         print("[ERROR] Received message without an 'action' field. Ignoring message.")
@@ -28,6 +58,11 @@ def handle_request(message, db_name):
         print("Pre-Prepare received, broadcasting to replicas...")
         transaction = message.get("transaction")
         if transaction:
+            key = request_key(transaction)
+            executed, reply = session_table.lookup(*key) if key is not None else (False, None)
+            if executed:
+                print(f"[DEBUG] Request {key} already executed. Answering from the session table.")
+                return reply
             for replica_id in range(2, total_nodes + 1):
                 send_to_node("127.0.0.1", 5000 + replica_id, {"action": "prepare", "transaction": transaction})
         else:
@@ -46,45 +81,48 @@ def handle_request(message, db_name):
         print("Commit received, processing transaction...")
         transaction = message.get("transaction")
         if transaction:
-            transaction_id = hash(json.dumps(transaction, sort_keys=True))  # Unique ID for the transaction
+            key = request_key(transaction)
 
-            # Ensure the transaction is not already executed
-            if transaction_id in executed_transactions:
-                print(f"[DEBUG] Transaction {transaction_id} already executed. Skipping.")
-                return
+            # Ensure the request is not already executed
+            executed, reply = session_table.lookup(*key) if key is not None else (False, None)
+            if executed:
+                print(f"[DEBUG] Request {key} already executed. Answering from the session table.")
+                return reply
 
-            # Initialize commit count for this transaction if not already done
-            if transaction_id not in commit_count:
-                commit_count[transaction_id] = set()
+            # Requests from clients without ids fall back to their canonical JSON form
+            transaction_id = key if key is not None else json.dumps(transaction, sort_keys=True)
 
             # Add the node ID to the set of commits for this transaction
-            node_id = message.get("node_id")
-            if node_id:
-                commit_count[transaction_id].add(node_id)
-                print(f"[DEBUG] Commit count for transaction {transaction_id}: {len(commit_count[transaction_id])}")
+            commits = commit_count.add(transaction_id, message.get("node_id"))
+            print(f"[DEBUG] Commit count for transaction {transaction_id}: {commits}")
 
             # Check if quorum is reached
-            if len(commit_count[transaction_id]) >= 2 * f + 1:  # Check if quorum is reached based on total nodes
+            if commits >= 2 * f + 1:  # Check if quorum is reached based on total nodes
+                # Commits arrive on concurrent connections, only the thread that claims the request executes it
+                if key is not None:
+                    claimed, reply = session_table.begin(*key)
+                    if not claimed:
+                        print(f"[DEBUG] Request {key} already executed or being executed. Answering from the session table.")
+                        return reply
+
                 print(f"[DEBUG] Quorum reached for transaction: {transaction}")
                 print("[DEBUG] Executing transaction...")
 
                 # Execute the transaction (Create Account, Deposit, Withdraw)
-                transaction_type = transaction.get("type")
-                if transaction_type == "create_account":
-                    banking_service.create_account(transaction.get("name"), transaction.get("balance"))
-                elif transaction_type == "deposit":
-                    banking_service.deposit(transaction.get("name"), transaction.get("amount"))
-                elif transaction_type == "withdraw":
-                    banking_service.withdraw(transaction.get("name"), transaction.get("amount"))
-                else:
-                    print(f"[WARNING] Unknown transaction type: {transaction_type}")
-
-                # Mark the transaction as executed
-                executed_transactions.add(transaction_id)
-
-            # Clean up commit count for the transaction
-            if transaction_id in commit_count:
-                del commit_count[transaction_id]
+                try:
+                    reply = execute_transaction(transaction)
+                except Exception:
+                    if key is not None:
+                        session_table.abort(*key)
+                    raise
+
+                # The votes are no longer needed once the transaction is executed
+                commit_count.release(transaction_id)
+
+                # Remember the reply so a retransmission is answered without executing again
+                if key is not None:
+                    session_table.record(*key, reply)
+                    session_table.collect_garbage()
         else:
             print("[WARNING] 'commit' message received without a transaction field. Ignoring.")
     else:
@@ -119,20 +157,20 @@ if __name__ == "__main__":
         if choice == "1":
             name = input("Name: ")
             balance = float(input("Initial Balance: "))
-            transaction = {"type": "create_account", "name": name, "balance": balance}
+            transaction = {"type": "create_account", "name": name, "balance": balance, "client_id": client_id, "request_seq": next(request_seq)}
             broadcast_to_all_replicas(transaction)
             #banking_service.create_account(name, balance)
 
         elif choice == "2":
             name = input("Name: ")
             amount = float(input("Deposit Amount: "))
-            transaction = {"type": "deposit", "name": name, "amount": amount}
+            transaction = {"type": "deposit", "name": name, "amount": amount, "client_id": client_id, "request_seq": next(request_seq)}
             broadcast_to_all_replicas(transaction)
             #banking_service.deposit(name, amount)
 
         elif choice == "3":
             name = input("Name: ")
             amount = float(input("Withdraw Amount: "))
-            transaction = {"type": "withdraw", "name": name, "amount": amount}
+            transaction = {"type": "withdraw", "name": name, "amount": amount, "client_id": client_id, "request_seq": next(request_seq)}
             broadcast_to_all_replicas(transaction)
             #banking_service.withdraw(name, amount)
@@ -1,6 +1,7 @@
 from shared.pbft_utils import start_listener
 from shared.banking_service import BankingService
 from shared.pbft_utils import send_to_node
+from shared.session_table import SessionTable, request_key
 import threading
 import json
 
@@ -8,6 +9,8 @@ node_id = 3  # Change to 3 for node_3.py
 db_name = f"databases/banking_node_{node_id}.db"
 banking_service = BankingService(db_name)
 total_nodes = 3
+# Executed requests and replies per client, so retransmissions are never executed twice
+session_table = SessionTable()
 
 def handle_request(message, db_name):
     action = message.get("action")
@@ -22,6 +25,11 @@ def handle_request(message, db_name):
         print("[DEBUG] Node {node_id} processing 'pre-prepare' action. Broadcasting 'prepare' to other replicas...")
         transaction = message.get("transaction")
         if transaction:
+            key = request_key(transaction)
+            executed, reply = session_table.lookup(*key) if key is not None else (False, None)
+            if executed:
+                print(f"[DEBUG] Node {node_id} already executed request {key}. Answering from the session table.")
+                return reply
             for replica_id in range(2, total_nodes + 1):
                 if replica_id != node_id:  # Skip self
                     send_to_node("127.0.0.1", 5000 + replica_id, {"action": "prepare", "transaction": transaction, "node_id": node_id})
@@ -45,15 +53,38 @@ def handle_request(message, db_name):
         print(f"[DEBUG] Node {node_id} received 'commit'. Executing transaction...")
         transaction = message.get("transaction")
         if transaction:
-            transaction_type = transaction.get("type")
-            if transaction_type == "create_account":
-                banking_service.create_account(transaction.get("name"), transaction.get("balance"))
-            elif transaction_type == "deposit":
-                banking_service.deposit(transaction.get("name"), transaction.get("amount"))
-            elif transaction_type == "withdraw":
-                banking_service.withdraw(transaction.get("name"), transaction.get("amount"))
-            else:
-                print(f"[WARNING] Node {node_id} received unknown transaction type: {transaction_type}")
+            # Every replica sends a commit, concurrently; only the thread that claims the request executes it
+            key = request_key(transaction)
+            if key is not None:
+                claimed, reply = session_table.begin(*key)
+                if not claimed:
+                    print(f"[DEBUG] Node {node_id} already executed or is executing request {key}. Answering from the session table.")
+                    return reply
+
+            try:
+                transaction_type = transaction.get("type")
+                if transaction_type == "create_account":
+                    banking_service.create_account(transaction.get("name"), transaction.get("balance"))
+                elif transaction_type == "deposit":
+                    banking_service.deposit(transaction.get("name"), transaction.get("amount"))
+                elif transaction_type == "withdraw":
+                    banking_service.withdraw(transaction.get("name"), transaction.get("amount"))
+                else:
+                    print(f"[WARNING] Node {node_id} received unknown transaction type: {transaction_type}")
+            except Exception:
+                if key is not None:
+                    session_table.abort(*key)
+                raise
+
+            if key is not None:
+                reply = {
+                    "client_id": transaction.get("client_id"),
+                    "request_seq": transaction.get("request_seq"),
+                    "status": "executed",
+                    "balance": banking_service.get_balance(transaction.get("name"))
+                }
+                session_table.record(*key, reply)
+                session_table.collect_garbage()
         else:
             print("[WARNING] 'commit' message received without a transaction field. Ignoring.")
 
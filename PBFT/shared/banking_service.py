@@ -1,43 +1,107 @@
 import sqlite3
 
+
+def to_cents(amount):
+    """Convert an amount of money to the integer cents stored in the database."""
+    return int(round(float(amount) * 100))
+
+
+def from_cents(cents):
+    """Convert stored integer cents back to an amount of money."""
+    return cents / 100
+
+
 class BankingService:
-    def __init__(self, db_name):
+    def __init__(self, db_name, synchronous="NORMAL"):
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self.create_table()
+        # WAL lets readers run next to the writer; with synchronous=NORMAL a commit only syncs at checkpoints
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        self.migrate()
+
+    def migrate(self):
+        """
+        Bring the schema up to date. The schema version is kept in
+        PRAGMA user_version, and every migration after it runs in its own
+        transaction together with the version bump.
+        """
+        migrations = [self.create_table, self.migrate_unique_names_and_cents]
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for target_version, migration in enumerate(migrations[version:], start=version + 1):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                migration()
+                self.conn.execute(f"PRAGMA user_version = {target_version}")
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            print(f"[DEBUG] Migrated the accounts database to schema version {target_version}")
 
     def create_table(self):
-        with self.conn:
-            self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                balance REAL NOT NULL DEFAULT 0.0
-            )
-            """)
+        # Schema version 1
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            balance REAL NOT NULL DEFAULT 0.0
+        )
+        """)
+
+    def migrate_unique_names_and_cents(self):
+        # Schema version 2: unique (and so indexed) names, integer-cent balances.
+        # Accounts with the same name are merged into the oldest one, the one lookups found,
+        # with their balances added to it so no money is lost; every merged row is logged.
+        duplicates = self.conn.execute("""
+        SELECT id, name, balance FROM accounts
+        WHERE id NOT IN (SELECT MIN(id) FROM accounts GROUP BY name)
+        ORDER BY id
+        """).fetchall()
+        for account_id, name, balance in duplicates:
+            print(f"[WARNING] Merging duplicate account {account_id} named {name} with balance {balance} into the oldest account of that name")
+        self.conn.execute("""
+        CREATE TABLE accounts_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            balance_cents INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        self.conn.execute("""
+        INSERT INTO accounts_v2 (id, name, balance_cents)
+        SELECT MIN(id), name, SUM(CAST(ROUND(balance * 100) AS INTEGER)) FROM accounts
+        GROUP BY name
+        """)
+        self.conn.execute("DROP TABLE accounts")
+        self.conn.execute("ALTER TABLE accounts_v2 RENAME TO accounts")
 
     def create_account(self, name, initial_balance):
         name = str(name)  # Ensure name is a string
         initial_balance = float(initial_balance)  # Ensure balance is a float
         print(f"[DEBUG] Creating account with name={name}, balance={initial_balance}")
-        self.conn.execute("INSERT INTO accounts (name, balance) VALUES (?, ?)", (name, initial_balance))
-        self.conn.commit()
+        try:
+            with self.conn:
+                self.conn.execute("INSERT INTO accounts (name, balance_cents) VALUES (?, ?)", (name, to_cents(initial_balance)))
+        except sqlite3.IntegrityError:
+            print(f"[WARNING] An account named {name} already exists.")
 
     def deposit(self, name, amount):
         with self.conn:
-            self.conn.execute("UPDATE accounts SET balance = balance + ? WHERE name = ?", (amount, name))
+            self.conn.execute("UPDATE accounts SET balance_cents = balance_cents + ? WHERE name = ?", (to_cents(amount), name))
         print(f"Deposited {amount} into {name}'s account.")
 
     def withdraw(self, name, amount):
         with self.conn:
-            cursor = self.conn.execute("SELECT balance FROM accounts WHERE name = ?", (name,))
-            row = cursor.fetchone()
-            if row and row[0] >= amount:
-                self.conn.execute("UPDATE accounts SET balance = balance - ? WHERE name = ?", (amount, name))
-                print(f"Withdrew {amount} from {name}'s account.")
-            else:
-                print("Insufficient funds or account not found.")
+            cursor = self.conn.execute(
+                "UPDATE accounts SET balance_cents = balance_cents - ? WHERE name = ? AND balance_cents >= ?",
+                (to_cents(amount), name, to_cents(amount))
+            )
+        if cursor.rowcount:
+            print(f"Withdrew {amount} from {name}'s account.")
+        else:
+            print("Insufficient funds or account not found.")
 
     def get_balance(self, name):
-        cursor = self.conn.execute("SELECT balance FROM accounts WHERE name = ?", (name,))
+        cursor = self.conn.execute("SELECT balance_cents FROM accounts WHERE name = ?", (name,))
         row = cursor.fetchone()
-        return row[0] if row else None
+        return from_cents(row[0]) if row else None
+
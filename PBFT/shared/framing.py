@@ -0,0 +1,95 @@
+import struct
+from collections import deque
+
+# Every frame is a 4-byte big-endian payload length followed by the payload
+HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # Refuse frames larger than 64 MiB
+RECV_BUFFER_SIZE = 64 * 1024
+
+
+class FrameError(ValueError):
+    """Raised when the byte stream does not contain a valid frame."""
+
+
+def encode_frame(payload):
+    """Prefix a payload with its length header."""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_frame(sock, payload):
+    """Send a single frame over a socket."""
+    sock.sendall(encode_frame(payload))
+
+
+class FrameDecoder:
+    """
+    Streaming decoder that splits an arbitrary sequence of byte chunks into
+    complete frames. Partial frames stay buffered until the rest arrives, so
+    frames may be split across reads or several frames may share one read.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        self.offset = 0  # Start of the first unconsumed byte in the buffer
+
+    def feed(self, data):
+        """Add received bytes and return every frame that is now complete."""
+        self.buffer += data
+        frames = []
+        while True:
+            available = len(self.buffer) - self.offset
+            if available < HEADER.size:
+                break
+            (length,) = HEADER.unpack_from(self.buffer, self.offset)
+            if length > self.max_frame_size:
+                raise FrameError(f"Frame of {length} bytes exceeds the {self.max_frame_size} byte limit")
+            if available < HEADER.size + length:
+                break
+            start = self.offset + HEADER.size
+            frames.append(bytes(self.buffer[start:start + length]))
+            self.offset = start + length
+
+        # Drop consumed bytes so the buffer only holds the pending partial frame
+        if self.offset:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        return frames
+
+    def pending(self):
+        """Number of buffered bytes that do not form a complete frame yet."""
+        return len(self.buffer) - self.offset
+
+
+class FrameReader:
+    """
+    Reads frames from a socket using one reusable receive buffer.
+    Frames that arrive together are queued and returned one at a time.
+    """
+
+    def __init__(self, sock, buffer_size=RECV_BUFFER_SIZE, max_frame_size=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.recv_buffer = bytearray(buffer_size)
+        self.view = memoryview(self.recv_buffer)
+        self.decoder = FrameDecoder(max_frame_size)
+        self.frames = deque()
+
+    def read(self):
+        """Return the next frame, or None once the peer closes the connection."""
+        while not self.frames:
+            received = self.sock.recv_into(self.view)
+            if not received:
+                if self.decoder.pending():
+                    raise FrameError("Connection closed in the middle of a frame")
+                return None
+            self.frames.extend(self.decoder.feed(self.view[:received]))
+        return self.frames.popleft()
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
@@ -2,20 +2,36 @@ import socket
 import json
 import threading
 
+from shared.framing import FrameError, FrameReader, send_frame
+from shared.session_table import InvalidRequest
+
 def send_to_node(host, port, message):
     try:
         client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         client_socket.connect((host, port))
-        client_socket.send(json.dumps(message).encode())
+        send_frame(client_socket, json.dumps(message).encode())
         client_socket.close()
     except ConnectionRefusedError:
         print(f"Node at {host}:{port} is not reachable.")
 
 def handle_connection(client_socket, db_name, handle_request):
-    data = client_socket.recv(1024).decode()
-    message = json.loads(data)
-    handle_request(message, db_name)
-    client_socket.close()
+    # A connection may carry several length-prefixed messages back-to-back
+    try:
+        for frame in FrameReader(client_socket):
+            message = json.loads(frame)
+            try:
+                reply = handle_request(message, db_name)
+            except InvalidRequest as e:
+                # A malformed client request is dropped, the connection keeps serving the next ones
+                print(f"[ERROR] Invalid request: {e}. Ignoring message.")
+                continue
+            # Replies (e.g. cached results for retransmitted requests) go back on the same connection
+            if reply is not None:
+                send_frame(client_socket, json.dumps(reply).encode())
+    except (OSError, FrameError, json.JSONDecodeError) as e:
+        print(f"Dropping connection after invalid or interrupted message: {e}")
+    finally:
+        client_socket.close()
 
 def start_listener(node_id, db_name, handle_request):
     host = "127.0.0.1"
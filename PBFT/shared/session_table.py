@@ -0,0 +1,143 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+
+class InvalidRequest(ValueError):
+    """Raised for a transaction whose (client_id, request_seq) pair is malformed."""
+
+
+class ClientSession:
+    """
+    Requests of one client that were executed or are being executed.
+    Sequence numbers up to low_watermark are all done. Above it, the
+    executed ones are tracked one by one with their replies, so requests
+    that commit out of order are neither skipped nor executed twice.
+    """
+
+    def __init__(self):
+        self.low_watermark = None
+        self.replies = {}  # request_seq -> reply, for executed requests above the low watermark
+        self.executed = []  # Heap of the request_seqs in replies, to advance the low watermark
+        self.in_progress = set()  # request_seqs claimed by a thread that is executing them
+        self.last_seen = time.monotonic()
+
+    def is_executed(self, request_seq):
+        return (self.low_watermark is not None and request_seq <= self.low_watermark) or request_seq in self.replies
+
+
+class SessionTable:
+    """
+    Client table used for exactly-once execution. For every client it keeps
+    the sequence numbers of its executed requests and the replies they
+    produced, so a retransmitted request is answered from the table instead
+    of being executed again. Only the window most recent executed requests
+    of a client are kept one by one; older ones are folded into the client's
+    low watermark. Clients idle for more than ttl seconds are dropped, and
+    at most max_clients sessions are kept (least recently used first out),
+    which keeps the table bounded.
+    """
+
+    def __init__(self, max_clients=10000, ttl=3600.0, window=1024):
+        self.max_clients = max_clients
+        self.ttl = ttl
+        self.window = window
+        self.sessions = OrderedDict()  # client_id -> ClientSession
+        self.lock = threading.Lock()
+
+    def _session(self, client_id):
+        """Return the client's session, creating it if needed. Called with the lock held."""
+        session = self.sessions.get(client_id)
+        if session is None:
+            session = self.sessions[client_id] = ClientSession()
+            while len(self.sessions) > self.max_clients:
+                self.sessions.popitem(last=False)
+        session.last_seen = time.monotonic()
+        self.sessions.move_to_end(client_id)
+        return session
+
+    def lookup(self, client_id, request_seq):
+        """
+        Check a request against the client's session. Returns (True, reply)
+        if it was already executed; reply is None once the request has been
+        folded into the low watermark. Returns (False, None) otherwise.
+        """
+        with self.lock:
+            session = self.sessions.get(client_id)
+            if session is None or not session.is_executed(request_seq):
+                return False, None
+            session.last_seen = time.monotonic()
+            self.sessions.move_to_end(client_id)
+            return True, session.replies.get(request_seq)
+
+    def begin(self, client_id, request_seq):
+        """
+        Claim a request for execution. Returns (True, None) if the caller
+        now owns it and must call record() or abort(). Returns (False, reply)
+        if it was already executed, and (False, None) while another thread
+        is executing it.
+        """
+        with self.lock:
+            session = self._session(client_id)
+            if session.is_executed(request_seq):
+                return False, session.replies.get(request_seq)
+            if request_seq in session.in_progress:
+                return False, None
+            session.in_progress.add(request_seq)
+            return True, None
+
+    def record(self, client_id, request_seq, reply):
+        """Remember the reply of a claimed request that has just been executed."""
+        with self.lock:
+            session = self._session(client_id)
+            session.in_progress.discard(request_seq)
+            if session.is_executed(request_seq):
+                return
+            session.replies[request_seq] = reply
+            heapq.heappush(session.executed, request_seq)
+            while len(session.executed) > self.window:
+                oldest = heapq.heappop(session.executed)
+                del session.replies[oldest]
+                session.low_watermark = oldest
+
+    def abort(self, client_id, request_seq):
+        """Give up a claim whose execution failed, so the request can be executed again."""
+        with self.lock:
+            session = self.sessions.get(client_id)
+            if session is not None:
+                session.in_progress.discard(request_seq)
+
+    def collect_garbage(self):
+        """Drop the sessions of clients idle for longer than the ttl."""
+        expiry = time.monotonic() - self.ttl
+        with self.lock:
+            # Sessions are kept in least recently used order, so idle ones come first
+            while self.sessions and next(iter(self.sessions.values())).last_seen < expiry:
+                self.sessions.popitem(last=False)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+
+def request_key(transaction):
+    """
+    Identify a transaction by the (client_id, request_seq) pair its client
+    assigned, or None if the client did not send one. Raises InvalidRequest
+    if the transaction is not a dict, only one of the two fields is set or
+    request_seq is not an integer.
+    """
+    if not isinstance(transaction, dict):
+        raise InvalidRequest(f"Transaction must be an object, got {type(transaction).__name__}")
+    client_id = transaction.get("client_id")
+    request_seq = transaction.get("request_seq")
+    if client_id is None and request_seq is None:
+        return None
+    if client_id is None or request_seq is None:
+        raise InvalidRequest("client_id and request_seq must be sent together")
+    if not isinstance(client_id, (str, int)) or isinstance(client_id, bool):
+        raise InvalidRequest(f"Invalid client_id {client_id!r}")
+    if not isinstance(request_seq, int) or isinstance(request_seq, bool):
+        raise InvalidRequest(f"Invalid request_seq {request_seq!r}")
+    return str(client_id), request_seq
@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class VoteStore:
+    """
+    Commit votes collected per transaction. The votes of a transaction are
+    released as soon as it is executed, and transactions that never reach a
+    quorum are evicted once they are older than horizon seconds, so the store
+    stays bounded however long the node runs.
+    """
+
+    def __init__(self, horizon=300.0):
+        self.horizon = horizon
+        self.votes = {}  # transaction_id -> [set of voters, time of the first vote], oldest first
+        self.lock = threading.Lock()
+
+    def add(self, transaction_id, voter):
+        """Add a voter and return how many distinct voters the transaction has."""
+        with self.lock:
+            entry = self.votes.get(transaction_id)
+            if entry is None:
+                self._collect_garbage()
+                entry = self.votes[transaction_id] = [set(), time.monotonic()]
+            if voter is not None:
+                entry[0].add(voter)
+            return len(entry[0])
+
+    def release(self, transaction_id):
+        """Drop the votes of an executed transaction."""
+        with self.lock:
+            self.votes.pop(transaction_id, None)
+
+    def _collect_garbage(self):
+        """Evict transactions older than the horizon. Called with the lock held."""
+        expiry = time.monotonic() - self.horizon
+        while self.votes and next(iter(self.votes.values()))[1] < expiry:
+            del self.votes[next(iter(self.votes))]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.votes)
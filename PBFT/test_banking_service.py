@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from shared.banking_service import BankingService
+
+
+class BankingServiceMigrationTest(unittest.TestCase):
+    """Tests for the schema migrations of the accounts database."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.tmp_dir.name, "bank.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_legacy_database(self, accounts):
+        """Create a schema version 0 database, with REAL balances and no unique names."""
+        conn = sqlite3.connect(self.db_name)
+        with conn:
+            conn.execute("""
+            CREATE TABLE accounts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                balance REAL NOT NULL DEFAULT 0.0
+            )
+            """)
+            conn.executemany("INSERT INTO accounts (name, balance) VALUES (?, ?)", accounts)
+        conn.close()
+
+    def open_service(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            service = BankingService(self.db_name)
+        self.addCleanup(service.conn.close)
+        return service, output.getvalue()
+
+    def test_converts_balances_to_cents(self):
+        self.create_legacy_database([("alice", 10.25), ("bob", 0.1)])
+        service, _ = self.open_service()
+        self.assertEqual(service.conn.execute("PRAGMA user_version").fetchone()[0], 2)
+        self.assertEqual(service.get_balance("alice"), 10.25)
+        self.assertEqual(service.get_balance("bob"), 0.1)
+
+    def test_merges_duplicate_accounts_into_the_oldest(self):
+        self.create_legacy_database([("alice", 10.0), ("bob", 5.0), ("alice", 2.5), ("alice", 0.25)])
+        service, output = self.open_service()
+        rows = service.conn.execute("SELECT id, name, balance_cents FROM accounts ORDER BY id").fetchall()
+        self.assertEqual(rows, [(1, "alice", 1275), (2, "bob", 500)])
+        # Every merged row is logged with its balance
+        self.assertIn("account 3 named alice with balance 2.5", output)
+        self.assertIn("account 4 named alice with balance 0.25", output)
+
+    def test_names_are_unique_after_the_migration(self):
+        self.create_legacy_database([("alice", 10.0), ("alice", 1.0)])
+        service, _ = self.open_service()
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.create_account("alice", 50)
+        self.assertEqual(service.get_balance("alice"), 11.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
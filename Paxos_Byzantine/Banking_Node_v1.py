@@ -1,6 +1,9 @@
 import atexit
+import hashlib
 import sqlite3
 import json
+import os
+import shutil
 import socket
 import sys
 import threading
@@ -9,6 +12,24 @@ import time
 import requests
 
 from collections import defaultdict
+from concurrent.futures import as_completed
+from functools import partial
+
+from account_cache import AccountCache
+from acceptor_wal import AcceptorWAL
+from async_runtime import AsyncNodeRuntime
+from codec import SUPPORTED_CODECS, CodecError, negotiate_codec
+from framing import FrameError
+from operation_log import OperationLog
+from peer_connections import PeerConnectionPool, serve_connection
+from proposal_batcher import ProposalBatcher
+from registry_client import RegistryClient
+from reputation_aggregator import ReputationAggregator
+from state_transfer import fetch_state, serve_state_transfer
+from storage_engine import StorageEngine
+from timer_service import TimerService
+from validation import LatencyModel, ValidationPool, parse_latency_model
+from vote_store import VoteStore
 
 #node 1 = 10.151.101.173
 #node 2 = 10.151.101.45
@@ -19,62 +40,259 @@ from collections import defaultdict
 node_ip = "127.0.0.1"
 #registry_ip = 10.151.101.221
 registry_ip = "127.0.0.1"
+# Pooled, caching client used for every call to the registry
+registry_client = RegistryClient(f"http://{registry_ip}:5000")
 
 active_nodes = {}
+# Membership is followed by long-polling the registry for changes
+membership_watch_timeout = 30  # Seconds a watch request waits for a change
+membership_retry_delay = 2  # Seconds to wait before watching again after a registry error
 max_proposal = 0
 
+# Stable leader (Multi-Paxos) mode: keep a won ballot and skip Phase 1 until preempted
+stable_leader_mode = False
+leader_ballot = None  # Ballot this node won and still holds, if any
+next_slot = 0  # Next slot to propose under leader_ballot
+leader_lock = threading.Lock()
+
+# Replicated log: every proposal targets a slot and decided batches are applied in slot order
+decided_slots = {}  # slot -> (proposal_number, actions) decided but not applied yet
+proposed_slots = {}  # slot -> (proposal_number, actions) this node proposed and has not applied yet
+next_apply_slot = 0  # Lowest slot that has not been applied
+highest_seen_slot = -1  # Highest slot of a proposal this node sent or accepted, reported in promises
+max_in_flight_slots = 1000  # Slots past next_apply_slot that a peer's message may refer to
+gap_check_slot = None  # Slot a scheduled gap check will resolve if it is still missing
+log_gap_timeout = 20  # Seconds a missing slot may hold back the decided slots before a no-op is proposed for it
+log_lock = threading.Lock()
+operation_log = None  # Durable record of the applied slots, opened when the node starts
+# Owner of the banking database: one writer thread applies decided slots, reads use pooled read-only connections
+storage_engine = None
+db_synchronous = "NORMAL"  # SQLite synchronous level of the writer: OFF, NORMAL or FULL
+account_cache_size = 100000  # Accounts whose balance is kept in memory for validation and balance reads
+snapshot_interval = 1000  # Applied slots between two snapshots of the database
+state_transfer_port = 8000  # Peers fetch snapshots and the log tail from this port
+
+# Actions from the menu are grouped into batches, one consensus instance per batch
+batch_max_size = 64
+batch_max_delay = 0.05  # Seconds the oldest queued action may wait for more actions
+proposal_batcher = None
+
+# Reputation changes are sent to the registry in batches, off the commit path
+reputation_flush_interval = 0.5  # Seconds between two batched updates to the registry
+reputation_aggregator = None
+
+# Long-lived connections to every peer, shared by all message types
+peer_pool = PeerConnectionPool()
+acceptor_lock = threading.Lock()
+# Promises and accepted values are logged before they are answered, so a restarted acceptor keeps them
+accepted_slots = {}  # slot -> (proposal_number, actions) accepted by this node
+acceptor_wal = None  # Write-ahead log of the acceptor state, opened when the node starts
+wal_checkpoint_interval = 10000  # Logged records between two rewrites of the WAL
+broadcast_lock = threading.Lock()
+learn_lock = threading.Lock()
+# Votes of each listener, released once their instance is decided and applied
+vote_horizon = 300  # Seconds after which the votes of an undecided instance are evicted
+verification_votes = VoteStore(vote_horizon)
+learn_votes = VoteStore(vote_horizon)
+
+# Set when the node runs on the single asyncio event loop instead of listener threads
+runtime = None
+# Shared scheduler for window deadlines and other timeouts when there is no event loop
+timer_service = TimerService()
+# Proposed batches are validated on their own workers, with a configurable simulated processing time
+validation_latency = LatencyModel("fixed", 10)
+validation_pool = ValidationPool(max_workers=8)
+
+def to_cents(amount):
+    """Convert an amount of money to the integer cents stored in the database."""
+    return int(round(amount * 100))
+
+def from_cents(cents):
+    """Convert stored integer cents back to an amount of money."""
+    return cents / 100
+
 class BankingService:
-    def __init__(self, db_name="banking.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.create_table()
+    def __init__(self, db_name="banking.db", read_only=False, synchronous="NORMAL"):
+        if read_only:
+            # Read-only connections are pooled, so they may move between threads
+            self.conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_name)
+            # WAL lets readers run next to the writer; with synchronous=NORMAL a commit only syncs at checkpoints
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"PRAGMA synchronous={synchronous}")
+            self.migrate()
+
+    def migrate(self):
+        """
+        Bring the schema up to date. The schema version is kept in
+        PRAGMA user_version, and every migration after it runs in its own
+        transaction together with the version bump.
+        """
+        migrations = [self.create_table, self.migrate_unique_names_and_cents, self.create_applied_slot]
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for target_version, migration in enumerate(migrations[version:], start=version + 1):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                migration()
+                self.conn.execute(f"PRAGMA user_version = {target_version}")
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            print(f"Migrated the accounts database to schema version {target_version}.")
 
     def create_table(self):
-        """Create the accounts table if it doesn't exist."""
+        """Schema version 1: create the accounts table if it doesn't exist."""
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            balance REAL NOT NULL DEFAULT 0.0
+        )
+        """)
+
+    def migrate_unique_names_and_cents(self):
+        """
+        Schema version 2: account names are unique, which also indexes them,
+        and balances are integer cents. Accounts with the same name are merged
+        into the oldest one, the one lookups used to find, and their balances
+        added to it so no money is lost; every merged account is logged.
+        """
+        duplicates = self.conn.execute("""
+        SELECT id, name, balance FROM accounts
+        WHERE id NOT IN (SELECT MIN(id) FROM accounts GROUP BY name)
+        ORDER BY id
+        """).fetchall()
+        for account_id, name, balance in duplicates:
+            print(f"Merging duplicate account {account_id} for {name} (balance {balance}) into the oldest account for {name}.")
+        self.conn.execute("""
+        CREATE TABLE accounts_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            balance_cents INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        self.conn.execute("""
+        INSERT INTO accounts_v2 (id, name, balance_cents)
+        SELECT MIN(id), name, SUM(CAST(ROUND(balance * 100) AS INTEGER)) FROM accounts
+        GROUP BY name
+        """)
+        self.conn.execute("DROP TABLE accounts")
+        self.conn.execute("ALTER TABLE accounts_v2 RENAME TO accounts")
+
+    def create_applied_slot(self):
+        """
+        Schema version 3: the database records the last log slot applied to
+        it, so a restart only replays the operation log after that slot.
+        It is unknown (NULL) for a database migrated from an older version.
+        """
+        self.conn.execute("CREATE TABLE applied_slot (slot INTEGER)")
+        self.conn.execute("INSERT INTO applied_slot (slot) VALUES (NULL)")
+
+    def applied_slot(self):
+        """Get the last log slot applied to the database, None if it is unknown."""
+        return self.conn.execute("SELECT slot FROM applied_slot").fetchone()[0]
+
+    def set_applied_slot(self, slot):
+        """Record the last log slot applied to the database, None if it is unknown."""
         with self.conn:
-            self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                balance REAL NOT NULL DEFAULT 0.0
-            )
-            """)
+            self.conn.execute("UPDATE applied_slot SET slot = ?", (slot,))
 
     def create_account(self, name, initial_balance=0.0):
         """Create a new account."""
-        with self.conn:
-            self.conn.execute("INSERT INTO accounts (name, balance) VALUES (?, ?)", (name, initial_balance))
-            print(f"Account created for {name} with initial balance {initial_balance}.")
+        try:
+            with self.conn:
+                self.conn.execute("INSERT INTO accounts (name, balance_cents) VALUES (?, ?)", (name, to_cents(initial_balance)))
+                print(f"Account created for {name} with initial balance {initial_balance}.")
+        except sqlite3.IntegrityError:
+            print(f"An account for {name} already exists.")
 
     def get_balance(self, name):
         """Get the balance of an account."""
-        cursor = self.conn.execute("SELECT balance FROM accounts WHERE name = ?", (name,))
+        cursor = self.conn.execute("SELECT balance_cents FROM accounts WHERE name = ?", (name,))
         row = cursor.fetchone()
         if row:
-            return row[0]
+            return from_cents(row[0])
         else:
             print(f"No account found for {name}.")
             return None
 
+    def get_balances(self, names):
+        """Get the balances of several accounts at once, None for the ones that don't exist."""
+        names = list(names)
+        balances = dict.fromkeys(names)
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = self.conn.execute(f"SELECT name, balance_cents FROM accounts WHERE name IN ({placeholders})", chunk)
+            for name, balance_cents in cursor:
+                balances[name] = from_cents(balance_cents)
+        return balances
+
     def deposit(self, name, amount):
         """Deposit money into an account."""
-        balance = self.get_balance(name)
-        if balance is not None:
-            new_balance = balance + amount
-            with self.conn:
-                self.conn.execute("UPDATE accounts SET balance = ? WHERE name = ?", (new_balance, name))
-                print(f"Deposited {amount} into {name}'s account. New balance: {new_balance}.")
+        with self.conn:
+            cursor = self.conn.execute("UPDATE accounts SET balance_cents = balance_cents + ? WHERE name = ?", (to_cents(amount), name))
+        if cursor.rowcount:
+            print(f"Deposited {amount} into {name}'s account.")
+        else:
+            print(f"No account found for {name}.")
 
     def withdraw(self, name, amount):
         """Withdraw money from an account."""
-        balance = self.get_balance(name)
-        if balance is not None:
-            if balance >= amount:
-                new_balance = balance - amount
-                with self.conn:
-                    self.conn.execute("UPDATE accounts SET balance = ? WHERE name = ?", (new_balance, name))
-                    print(f"Withdrew {amount} from {name}'s account. New balance: {new_balance}.")
-            else:
-                print(f"Insufficient funds in {name}'s account. Available balance: {balance}.")
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE accounts SET balance_cents = balance_cents - ? WHERE name = ? AND balance_cents >= ?",
+                (to_cents(amount), name, to_cents(amount))
+            )
+        if cursor.rowcount:
+            print(f"Withdrew {amount} from {name}'s account.")
+        else:
+            print(f"Insufficient funds or no account found for {name}.")
+
+    def apply_batch(self, actions, slot=None):
+        """
+        Apply a list of actions in a single transaction. Runs of consecutive
+        actions of the same type go to SQLite as one executemany, and each
+        action is one conditional statement, so a withdrawal without enough
+        funds or a second account with the same name simply changes nothing.
+        The log slot of the batch, if given, is recorded in the same transaction.
+        Returns the number of actions applied.
+        """
+        statements = {
+            "create_account": ("INSERT OR IGNORE INTO accounts (name, balance_cents) VALUES (?, ?)",
+                               lambda action: (action["name"], to_cents(action["initial_balance"]))),
+            "deposit": ("UPDATE accounts SET balance_cents = balance_cents + ? WHERE name = ?",
+                        lambda action: (to_cents(action["amount"]), action["name"])),
+            "withdraw": ("UPDATE accounts SET balance_cents = balance_cents - ? WHERE name = ? AND balance_cents >= ?",
+                         lambda action: (to_cents(action["amount"]), action["name"], to_cents(action["amount"]))),
+        }
+        applied = 0
+        with self.conn:
+            run_type, run = None, []
+            for action in actions + [None]:
+                action_type = action.get("action") if action is not None else None
+                if action is not None and action_type not in statements:
+                    print(f"Unknown action: {action_type}")
+                    continue
+                if action_type != run_type and run:
+                    cursor = self.conn.executemany(statements[run_type][0], run)
+                    applied += cursor.rowcount
+                    run = []
+                if action is not None:
+                    run_type = action_type
+                    run.append(statements[action_type][1](action))
+            if slot is not None:
+                self.conn.execute("UPDATE applied_slot SET slot = ?", (slot,))
+        return applied
+
+    def accounts_digest(self):
+        """Hash of every account name and balance, equal for two databases with the same accounts."""
+        digest = hashlib.sha256()
+        for name, balance_cents in self.conn.execute("SELECT name, balance_cents FROM accounts ORDER BY name"):
+            digest.update(json.dumps([name, balance_cents]).encode())
+        return digest.hexdigest()
 
     def close(self):
         """Close the database connection."""
@@ -82,7 +300,6 @@ class BankingService:
 
 def menu(node_id):
     db_name = f"banking_node_{node_id}.db"  # Unique DB for each node
-    banking_service = BankingService(db_name=db_name)  # Initialize once for this node
     print(f"Node {node_id} is running with database '{db_name}'")
 
     while True:
@@ -92,144 +309,291 @@ def menu(node_id):
         print("3. Withdraw Money")
         print("4. Check Balance")
         print("5. Exit")
+        print("6. Account Cache Statistics")
         choice = input("Enter your choice: ")
 
         if choice == "1":
             name = input("Enter account holder's name: ")
             initial_balance = float(input("Enter initial balance: "))
             action = {"action": "create_account", "name": name, "initial_balance": initial_balance}
-            if send_prepare_message(node_id):
-                #send propose message
-                send_propose_message(node_id, action)
+            proposal_batcher.add(action)
 
         elif choice == "2":
             name = input("Enter account holder's name: ")
             amount = float(input("Enter amount to deposit: "))
             action = {"action": "deposit", "name": name, "amount": amount}
-            if send_prepare_message(node_id):
-                #send propose message
-                send_propose_message(node_id, action)
+            proposal_batcher.add(action)
 
 
         elif choice == "3":
             name = input("Enter account holder's name: ")
             amount = float(input("Enter amount to withdraw: "))
             action = {"action": "withdraw", "name": name, "amount": amount}
-            if send_prepare_message(node_id):
-                #send propose message
-                send_propose_message(node_id, action)
+            proposal_batcher.add(action)
 
         elif choice == "4":
             name = input("Enter account holder's name: ")
-            balance = banking_service.get_balance(name)
+            balance = storage_engine.get_balance(name)
             if balance is not None:
                 print(f"{name}'s current balance: {balance}")
 
         elif choice == "5":
             print(f"Exiting Banking Service for Node {node_id}. Goodbye!")
-            banking_service.close()
+            # Propose whatever is still queued before leaving
+            proposal_batcher.close()
             break
 
+        elif choice == "6":
+            stats = storage_engine.cache.stats()
+            print(f"Cached accounts: {stats['entries']}/{stats['max_entries']}, "
+                  f"hits: {stats['hits']}, misses: {stats['misses']}, "
+                  f"hit rate: {stats['hit_rate']:.1%}, evictions: {stats['evictions']}")
+
         else:
             print("Invalid choice. Please try again.")
 
+def handle_prepare_reply(other_node_id, future):
+    """
+    Log the outcome of a Prepare request, returning True if the node promised.
+    """
+    try:
+        response = future.result()
+    except (socket.error, FrameError, CodecError, json.JSONDecodeError) as e:
+        print(f"Node {other_node_id} did not respond or failed to process the message: {e}")
+        return False
+
+    # Check the response
+    if response.get("status") == "promise":
+        print(f"Node {other_node_id} responded with Promise.")
+        return True
+    print(f"Node {other_node_id} rejected Prepare: {response}")
+    return False
+
+def handle_late_prepare_reply(other_node_id, future):
+    """Handle a Prepare reply that arrived after the majority was already reached."""
+    print(f"Late reply to Prepare from Node {other_node_id} (majority already reached).")
+    handle_prepare_reply(other_node_id, future)
+
 def send_prepare_message(node_id):
     """
     Sends a Prepare message to all other active nodes in the cluster using sockets.
+    The requests are issued concurrently and the function returns as soon as a
+    majority has promised; replies that arrive later are handled in the background.
+    Returns the promised proposal number, the first log slot that none of
+    the promising acceptors has seen yet and the values they accepted in
+    slots that are still open ({slot: (proposal_number, actions)}, highest
+    proposal per slot), or (None, None, None) without a majority.
     """
     global active_nodes, max_proposal
-    max_proposal += 1  # Increment global proposal number
-    prepare_message = {"type": "prepare", "proposal_number": max_proposal}
+    with acceptor_lock:
+        max_proposal += 1  # Increment global proposal number
+        proposal_number = max_proposal
+        # This node is an acceptor too, its own accepted values count like a promise's
+        accepted_values = dict(accepted_slots)
+    # The node's own ballot is logged like a promise, so it is never reused after a restart
+    acceptor_wal.append({"type": "promise", "proposal_number": proposal_number})
+    prepare_message = {"type": "prepare", "proposal_number": proposal_number}
     promises_received = 0
+    # Start past every slot this node has seen, promises may push it further
+    with log_lock:
+        log_slot = max(highest_seen_slot + 1, next_apply_slot)
     majority = ((len(active_nodes) - 1) // 2) + 1  # Majority threshold
 
-    print(f"Node {node_id} is sending Prepare message with proposal number {max_proposal}...")
+    print(f"Node {node_id} is sending Prepare message with proposal number {proposal_number}...")
 
-    for other_node_id, node_info in active_nodes.items():
+    # Issue the prepare to every peer at once over the pooled connections
+    pending = {}  # future -> node_id
+    for other_node_id, node_info in list(active_nodes.items()):
         if str(other_node_id) == str(node_id):
             continue  # Skip sending to itself
-        
-        try:
-            # Extract host and port from the node's URL
-            host = node_info['url'].split(":")[1].replace("/", "")
-            port = node_info['url'].split(":")[2]
-            port = int(port)
-
-            # Connect to the other node
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((host, port))
-
-                # Send the prepare message
-                s.sendall(json.dumps(prepare_message).encode())
 
-                # Receive the response
-                response_data = s.recv(1024).decode()
-                response = json.loads(response_data)
-
-                # Check the response
-                if response.get("status") == "promise":
-                    promises_received += 1
-                    print(f"Node {other_node_id} responded with Promise.")
-                else:
-                    print(f"Node {other_node_id} rejected Prepare: {response}")
+        # Extract host and port from the node's URL
+        host = node_info['url'].split(":")[1].replace("/", "")
+        port = node_info['url'].split(":")[2]
+        port = int(port)
+
+        future = peer_pool.request_async(other_node_id, host, port, prepare_message)
+        pending[future] = other_node_id
+
+    # Count replies as they arrive and stop waiting once the majority is reached
+    for future in as_completed(pending):
+        other_node_id = pending.pop(future)
+        if handle_prepare_reply(other_node_id, future):
+            promises_received += 1
+            response = future.result()
+            # A faulty acceptor must not push the log arbitrarily far ahead
+            if in_slot_window(response.get("next_slot", 0)):
+                log_slot = max(log_slot, response.get("next_slot", 0))
+            for accepted in response.get("accepted", []):
+                if not in_slot_window(accepted["slot"]):
+                    continue
+                previous = accepted_values.get(accepted["slot"])
+                if previous is None or previous[0] < accepted["proposal_number"]:
+                    accepted_values[accepted["slot"]] = (accepted["proposal_number"], accepted["actions"])
+        if promises_received >= majority:
+            break
 
-        except (socket.error, json.JSONDecodeError) as e:
-            print(f"Node {other_node_id} did not respond or failed to process the message: {e}")
+    for future, other_node_id in pending.items():
+        future.add_done_callback(partial(handle_late_prepare_reply, other_node_id))
 
     print(f"Promises received: {promises_received}/{len(active_nodes) - 1} (Majority needed: {majority})")
-    return promises_received >= majority
+    if promises_received < majority:
+        return None, None, None
+
+    # Values that may already be chosen must be proposed again, slots this node applied are settled
+    with log_lock:
+        first_open_slot = next_apply_slot
+        settled_slots = set(decided_slots)
+    recovered = {
+        slot: accepted for slot, accepted in accepted_values.items()
+        if slot >= first_open_slot and slot not in settled_slots
+    }
+    return proposal_number, log_slot, recovered
+
+def handle_propose_sent(node_id, other_node_id, future):
+    """Report a Propose message that could not be delivered."""
+    try:
+        future.result()
+    except (socket.error, FrameError, CodecError, json.JSONDecodeError) as e:
+        print(f"Node {node_id} failed to send Propose message to {other_node_id}: {e}")
 
-def send_propose_message(node_id, action):
+def send_propose_message(node_id, actions, proposal_number, slot=0):
     """
-    Sends a Propose message to all acceptors with the value to be accepted.
+    Sends a Propose message to all acceptors with the batch of actions to be accepted.
+    The message is queued to every acceptor concurrently without waiting for delivery.
     """
-    global active_nodes, max_proposal
+    global active_nodes
     propose_message = {
         "type": "propose",
-        "proposal_number": max_proposal,
-        "action": action,
+        "proposal_number": proposal_number,
+        "slot": slot,
+        "actions": actions,
         "proposer_id": node_id
 
     }
 
-    print(f"Node {node_id} is sending Propose message with proposal number {max_proposal} and action {action}...")
+    print(f"Node {node_id} is sending Propose message with proposal number {proposal_number} (slot {slot}) and {len(actions)} actions {actions}...")
 
-    for other_node_id, node_info in active_nodes.items():
+    for other_node_id, node_info in list(active_nodes.items()):
         if str(other_node_id) == str(node_id):
             continue  # Skip sending to itself
-        
-        try:
-            # Extract host and port from the node's URL
-            host = node_info['url'].split(":")[1].replace("/", "")
-            port = node_info['url'].split(":")[2]
-            port = int(port)
 
-            # Connect to the other node
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((host, port))
+        # Extract host and port from the node's URL
+        host = node_info['url'].split(":")[1].replace("/", "")
+        port = node_info['url'].split(":")[2]
+        port = int(port)
 
-                # Send the propose message
-                s.sendall(json.dumps(propose_message).encode())
+        # Queue the propose message on the pooled connection
+        future = peer_pool.send_async(other_node_id, host, port, propose_message)
+        future.add_done_callback(partial(handle_propose_sent, node_id, other_node_id))
 
+def propose_batch(node_id, actions):
+    """
+    Runs one consensus instance for a batch of actions in the next free log
+    slot. The call returns once Propose is queued, so the next batch can be
+    proposed while this one is still being verified.
+    In stable leader mode a node that still holds the ballot it won skips
+    Phase 1 and only sends Propose for the next slot; it runs Prepare again
+    once another node has promised a higher ballot.
+    """
+    global leader_ballot, next_slot
+    with leader_lock:
+        # Another proposer's higher Prepare raised max_proposal, so the ballot is lost
+        if leader_ballot is not None and leader_ballot != max_proposal:
+            print(f"Node {node_id} was preempted, ballot {leader_ballot} is no longer the highest.")
+            leader_ballot = None
+
+        if stable_leader_mode and leader_ballot is not None:
+            proposal_number, slot = leader_ballot, next_slot
+            next_slot += 1
+        else:
+            proposal_number, slot = win_ballot(node_id)
+            if proposal_number is None:
+                return False
+            if stable_leader_mode:
+                next_slot = slot + 1
 
+        #send propose message (queued under the lock so slots reach each peer in order)
+        propose_slot(node_id, actions, proposal_number, slot)
+    return True
 
-        except (socket.error, json.JSONDecodeError) as e:
-            print(f"Node {node_id} failed to send Propose message to {other_node_id}: {e}")
+def win_ballot(node_id, stuck_slot=None):
+    """
+    Run Phase 1 for a new ballot and return it with the first free log
+    slot, or (None, None) without a majority. Called with leader_lock held.
+    The values the acceptors accepted in open slots are proposed again under
+    the new ballot, so a batch that may already be decided is never replaced
+    by a different one. Slots this node proposed itself and that were
+    accepted with that very value are still being verified and are left
+    alone, so a new batch does not re-run every batch still in flight;
+    stuck_slot is proposed again in any case.
+    """
+    global leader_ballot, next_slot
+    proposal_number, slot, recovered = send_prepare_message(node_id)
+    if proposal_number is None:
+        leader_ballot = None
+        return None, None
+    if stable_leader_mode:
+        leader_ballot, next_slot = proposal_number, slot
+
+    for recovered_slot, accepted in sorted(recovered.items()):
+        with log_lock:
+            in_flight = proposed_slots.get(recovered_slot) == accepted
+        if in_flight and recovered_slot != stuck_slot:
+            continue
+        print(f"Proposing slot {recovered_slot} again with the value accepted under proposal {accepted[0]}.")
+        propose_slot(node_id, accepted[1], proposal_number, recovered_slot)
+    return proposal_number, slot
 
-def broadcast_verification_message(proposal_number, status, node_id, action, proposer_id):
+def propose_no_op(node_id, slot):
+    """
+    Propose a no-op for a slot that holds back the decided slots after it.
+    Prepare runs first, so a value an acceptor already accepted for the slot
+    is proposed instead; either way the slot is decided by the verifiers
+    like any other proposal, this node never skips it on its own.
+    """
+    with leader_lock:
+        with log_lock:
+            if next_apply_slot != slot or slot in decided_slots:
+                return
+        proposal_number, _ = win_ballot(node_id, stuck_slot=slot)
+        if proposal_number is None:
+            return
+        with log_lock:
+            proposed = proposed_slots.get(slot)
+        # win_ballot already proposed the value an acceptor accepted for the slot
+        if proposed is None or proposed[0] != proposal_number:
+            print(f"Proposing a no-op for slot {slot} under proposal {proposal_number}.")
+            propose_slot(node_id, [], proposal_number, slot)
+
+def propose_slot(node_id, actions, proposal_number, slot):
+    """
+    Queue Propose for a slot and remember the slot as in flight, so later
+    prepares from this node neither reuse it nor propose it again.
+    Called with leader_lock held, so slots reach each peer in order.
+    """
+    note_slot(slot)
+    with log_lock:
+        if slot >= next_apply_slot:
+            proposed_slots[slot] = (proposal_number, actions)
+    send_propose_message(node_id, actions, proposal_number, slot)
+
+def broadcast_verification_message(proposal_number, slot, status, node_id, actions, proposer_id):
     """
     Function to send a verification message to all other nodes except the proposer.
     """
     verification_message = {
         "type": "verify",
         "proposal_number": proposal_number,
+        "slot": slot,
         "status": status,
-        "action": action,
+        "actions": actions,
         "node_id": node_id,
         "proposer_id": proposer_id
     }
 
-    for other_node_id, node_info in active_nodes.items():
+    # Iterate over a copy, the membership watch may change active_nodes while messages are sent
+    for other_node_id, node_info in list(active_nodes.items()):
         # Skip the proposer node
         if str(other_node_id) == str(proposer_id):
             print(f"Skipping proposer Node {proposer_id}.")
@@ -241,20 +605,117 @@ def broadcast_verification_message(proposal_number, status, node_id, action, pro
             port = 6000  # Adjust this to the correct port if needed
             port = int(port)
 
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((host, port))
-                s.sendall(json.dumps(verification_message).encode())
+            peer_pool.send(other_node_id, host, port, verification_message)
         except (socket.error, json.JSONDecodeError) as e:
             print(f"Node {node_id} failed to send verification message to {other_node_id}: {e}")
 
-def stop_listening(stop_flag, proposal_number):
+def handle_broadcast_message(message, node_id, proposal_responses, stop_flag):
     """
-    Function to stop listening after the time limit (10 seconds).
-    Sets a stop flag to True when the timer expires.
+    Handle one verification message received on the broadcast listener.
+    The proposal is verified once the votes reach a quorum, or when its
+    10 second window closes if the quorum is never reached. Votes that
+    arrive after the decision still count for reputation, which is settled
+    once every expected voter voted or the window closed.
     """
-    time.sleep(10)
-    print("Time limit reached. Stopping the listener.")
-    stop_flag[proposal_number] = True
+    print(f"Received broadcast message: {message}")
+
+    if message.get("type") == "verify":
+        proposal_number = message["proposal_number"]
+        slot = message.get("slot", 0)  # Nodes without stable leader support only use slot 0
+        node_id_received = message["node_id"]
+        status = message["status"]
+        actions = message_actions(message)
+        proposer_id = message["proposer_id"]
+        print(f"Node {node_id} received broadcast verification for proposal {proposal_number} (slot {slot})")
+        instance = (proposal_number, slot)
+        if not in_slot_window(slot):
+            print(f"Ignoring verification from Node {node_id_received} for slot {slot}, outside the log window.")
+            return
+
+        with broadcast_lock:
+            if proposal_responses.is_settled(instance):
+                print(f"Ignoring late verification from Node {node_id_received} for settled proposal {instance}.")
+                return
+
+            # Check if this is a new proposal instance that we haven't started a timer for yet
+            if instance not in stop_flag:
+                stop_flag[instance] = False
+                # Close the window after 10 seconds at the latest, nothing is polled
+                run_later(10, close_broadcast_window, instance, proposal_responses, stop_flag)
+
+            # Add the response to the list of responses for this proposal instance
+            responses = proposal_responses.add(instance, {
+                "node_id": node_id_received,
+                "status": status,
+                "actions": actions,
+                "proposer_id": proposer_id
+            })
+
+            # Decide as soon as the votes settle the proposal instead of waiting for the timer
+            voters = expected_voters(proposer_id)
+            decide_now = quorum_reached(responses, voters) and proposal_responses.decide(instance)
+
+        if decide_now:
+            print(f"Quorum reached for proposal {proposal_number} (slot {slot}), verifying now.")
+            proposal_responses.set_outcome(instance, verify_proposal(instance, active_nodes, proposal_responses))
+        settle_verification(proposal_responses.settle(instance, voters))
+
+    else:
+        print(f"Received unexpected message type: {message.get('type')}")
+
+def close_broadcast_window(instance, proposal_responses, stop_flag):
+    """
+    Verify a proposal once its verification window has closed, unless a
+    quorum already decided it, and settle the reputation of its voters.
+    """
+    with broadcast_lock:
+        stop_flag.pop(instance, None)
+        decide_now = proposal_responses.decide(instance)
+    if decide_now:
+        proposal_responses.set_outcome(instance, verify_proposal(instance, active_nodes, proposal_responses))
+    proposal_responses.close(instance)
+    settle_verification(proposal_responses.settle(instance))
+
+def split_votes(votes, outcome):
+    """
+    Split the voters of an instance into the nodes that approved the
+    decided batch and the nodes that rejected it or voted for another one.
+    """
+    supporters = set()
+    dissenters = set()
+    for vote in votes:
+        if vote.get("status", "approved") == "approved" and vote.get("actions") == outcome:
+            supporters.add(str(vote["node_id"]))
+        else:
+            dissenters.add(str(vote["node_id"]))
+    # A node that voted both ways is not trusted for either vote
+    return supporters - dissenters, dissenters
+
+def update_reputations(supporters, malicious_nodes):
+    """Increase the reputation of the supporters and decrease it for the malicious nodes."""
+    for node in sorted(supporters):
+        if node in active_nodes:
+            increase_reputation(node)
+    for node in sorted(malicious_nodes):
+        if node in active_nodes:
+            decrease_reputation(node)
+    print("Final list of active nodes: ", active_nodes)
+
+def settle_verification(settlement):
+    """
+    Adjust reputations once a verified instance is settled: every node that
+    voted for the decided batch gains reputation, every node that rejected
+    it or voted for another batch loses some, including votes that arrived
+    after the decision. Instances decided as a no-op change no reputation.
+    """
+    if settlement is None:
+        return
+    votes, outcome = settlement
+    if not outcome:
+        return
+    supporters, malicious_nodes = split_votes(votes, outcome)
+    print(f"Settled proposal with {len(votes)} votes, malicious nodes: {sorted(malicious_nodes)}")
+    update_reputations(supporters, malicious_nodes)
 
 def listen_for_broadcasts(node_id):
     """
@@ -268,7 +729,7 @@ def listen_for_broadcasts(node_id):
     threshold = 2 * f + 1  # Threshold for BFT consensus
 
     # Track the responses for each proposal number
-    proposal_responses = defaultdict(list)  # proposal_number -> list of {node_id, status}
+    proposal_responses = verification_votes  # (proposal_number, slot) -> list of {node_id, status}
 
     host = "0.0.0.0"
     port = 6000  # Use a different port for broadcast communication
@@ -279,72 +740,22 @@ def listen_for_broadcasts(node_id):
     server_socket.listen(5)
     print(f"Node {node_id} listening for broadcasts on port {port}...")
 
-    # Set a timeout for accepting connections (non-blocking mode)
-    server_socket.settimeout(1.0)  # 1 second timeout
-
-    # Flags to stop listening after time expires {proposal_number: stop_flag}
+    # Windows still collecting votes {(proposal_number, slot): False}, closed by the timer service
     stop_flag = {}
 
 
     while True:  # Continue listening until time expires
         try:
-            # Try to accept a connection (this will not block for more than the set timeout)
             client_socket, addr = server_socket.accept()  # Accept incoming connection
-            print(f"Received broadcast message from {addr}")
+            print(f"Received broadcast connection from {addr}")
 
-            # Receive the message from the client
-            message_data = client_socket.recv(1024).decode()
-            try:
-                message = json.loads(message_data)
-                print(f"Received broadcast message: {message}")
-
-                if message.get("type") == "verify":
-                    proposal_number = message["proposal_number"]
-                    node_id_received = message["node_id"]
-                    status = message["status"]
-                    action = message["action"]
-                    proposer_id = message["proposer_id"]
-                    print(f"Node {node_id} received broadcast verification for proposal {proposal_number}")
-
-                    # Check if this is a new proposal number that we haven't started a timer for yet
-                    if proposal_number not in stop_flag:
-                        stop_flag[proposal_number] = False
-                        # Start a timer to stop listening after 10 seconds
-                        timer = threading.Thread(target=stop_listening, args=(stop_flag, proposal_number))
-                        timer.start()
-
-                    # Add the response to the list of responses for this proposal number
-                    proposal_responses[proposal_number].append({
-                        "node_id": node_id_received,
-                        "status": status,
-                        "action": action,
-                        "proposer_id": proposer_id
-                    })
-
-                else:
-                    print(f"Received unexpected message type: {message.get('type')}")
-
-            except json.JSONDecodeError:
-                print(f"Failed to decode broadcast message from {addr}. Ignoring.")
-            except Exception as e:
-                print(f"Error processing broadcast message from {addr}: {e}")
-
-            finally:
-                client_socket.close()
-
-        except socket.timeout:
-            # Timeout reached, check if any proposals have expired
-            expired_proposals = []  # Store expired proposals to delete after iteration
-            for proposal_number, stop_flag_value in stop_flag.items():
-                if stop_flag_value == False:
-                    continue
-                else:
-                    verify_proposal(proposal_number,active_nodes,proposal_responses)
-                    expired_proposals.append(proposal_number)
+            # Peers keep the connection open, serve its messages on a separate thread
+            threading.Thread(
+                target=serve_connection,
+                args=(client_socket, addr, handle_broadcast_message, node_id, proposal_responses, stop_flag),
+                daemon=True
+            ).start()
 
-            # Remove expired proposals from stop_flag after the iteration
-            for proposal_number in expired_proposals:
-                del stop_flag[proposal_number]
         except Exception as e:
             print(f"Error accepting connection: {e}")
             continue
@@ -355,17 +766,53 @@ def get_reputation(node_id):
     Get the reputation of a node from the active nodes dictionary.
     """
     global active_nodes
-    return active_nodes[str(node_id)]['reputation'] if str(node_id) in active_nodes else 0
+    node_info = active_nodes.get(str(node_id))
+    return node_info['reputation'] if node_info is not None else 0
 
-def verify_proposal(proposal_number, active_nodes, proposal_responses):
+def expected_voters(excluded_node_id):
+    """
+    Nodes expected to vote on an instance: every active node with enough
+    reputation to be counted, except excluded_node_id.
+    """
+    return [
+        other_node_id for other_node_id in list(active_nodes)
+        if str(other_node_id) != str(excluded_node_id) and get_reputation(other_node_id) >= 50
+    ]
+
+def quorum_reached(responses, voters):
+    """
+    Check whether the votes collected so far settle an instance: 2f+1 of the
+    expected voters approved the same batch, or every expected voter voted.
+    At least 3 votes are always required, as for BFT verification.
+    """
+    f = (len(voters) - 1) // 3
+    threshold = 2 * f + 1
+
+    votes = [response for response in responses if str(response["node_id"]) in voters]
+    if len(votes) < 3:
+        return False
+
+    batch_count = defaultdict(int)
+    for response in votes:
+        if response.get("status", "approved") == "approved":
+            batch_count[json.dumps(response["actions"], sort_keys=True)] += 1
+    if batch_count and max(batch_count.values()) >= threshold:
+        return True
+    return len({str(response["node_id"]) for response in votes}) >= len(voters)
+
+def verify_proposal(instance, active_nodes, proposal_responses):
     """
     Function to verify the proposal responses and check for BFT consensus.
+    The instance is the (proposal_number, slot) pair the responses were collected for.
+    Returns the batch the instance is decided with, [] for a no-op, or None
+    if this node got too few votes to decide it.
     """
     global max_proposal
+    proposal_number, slot = instance
 
     #Remove nodes under 50 reputation
     valid_responses = [
-        response for response in proposal_responses[proposal_number]
+        response for response in proposal_responses.responses(instance)
         if "node_id" in response and get_reputation(response["node_id"]) >= 50
     ]
 
@@ -376,14 +823,16 @@ def verify_proposal(proposal_number, active_nodes, proposal_responses):
     threshold = 2 * f + 1  # Threshold for BFT consensus
     malicious_nodes = []
 
-    print(f"Verifying proposal {proposal_number} responses...")
+    print(f"Verifying proposal {proposal_number} (slot {slot}) responses...")
+
+    # Get the responses for this proposal number
+    responses = proposal_responses.responses(instance)
+    proposer_id = responses[0]["proposer_id"] if responses else None
 
     if total_nodes < 3:
         print(f"Insufficient nodes for BFT consensus. Minimum 3 nodes required, but {total_nodes} found.")
-        return
-
-    # Get the responses for this proposal number
-    responses = proposal_responses[proposal_number]
+        # Other nodes may have seen enough votes, the slot is left open for them or the gap check
+        return None
 
     # Count the number of approvals and rejections
     approvals = 0
@@ -409,23 +858,22 @@ def verify_proposal(proposal_number, active_nodes, proposal_responses):
         for response in responses:
             if response["status"] == "rejected":
                 continue
-            action = response["action"]
 
-            # Convert the action dictionary to a tuple of sorted key-value pairs for hashing
-            action_key = tuple(sorted(action.items()))
+            # Serialize the batch with sorted keys so identical batches hash the same
+            actions_key = json.dumps(response["actions"], sort_keys=True)
 
-            action_count[action_key] += 1
+            action_count[actions_key] += 1
 
-        # Determine the majority action
-        majority_action_key = max(action_count, key=action_count.get)
+        # Determine the majority batch
+        majority_actions_key = max(action_count, key=action_count.get)
 
-        # Convert the majority action key back to a dictionary for comparison
-        majority_action = dict(majority_action_key)
+        # Convert the majority key back to the list of actions for comparison
+        majority_actions = json.loads(majority_actions_key)
 
         # Identify malicious nodes
         malicious_nodes = [
             str(response["node_id"]) for response in responses
-            if "action" not in response or dict(sorted(response["action"].items())) != majority_action
+            if "actions" not in response or response["actions"] != majority_actions
         ]
 
         #Append reject nodes to malicious nodes
@@ -433,29 +881,30 @@ def verify_proposal(proposal_number, active_nodes, proposal_responses):
             if response["status"] == "rejected":
                 malicious_nodes.append(str(response["node_id"]))
 
-        print(f"Majority action: {majority_action}")
+        print(f"Majority actions: {majority_actions}")
         print(f"Malicious nodes: {malicious_nodes}")
 
-        send_learn_message(response["proposer_id"], proposal_number, majority_action, node_id, malicious_nodes)
-
-        # Perform the action locally
-        perform_action(majority_action, BankingService(db_name=f"banking_node_{node_id}.db"))
+        send_learn_message(proposer_id, proposal_number, slot, majority_actions, node_id, malicious_nodes)
 
-        # Increase reputation for non-malicious nodes
-        for node in active_nodes:
-            if node not in malicious_nodes:
-                print(f"Reputation increased for Node {node}.")
-                increase_reputation(node)
-            else:
-                print(f"Reputation decreased for Node {node}.")
-                decrease_reputation(node)
-        print("Final list of active nodes: ", active_nodes)
+        # Apply the batch locally once every earlier slot has been applied
+        commit_slot(node_id, slot, proposal_number, majority_actions)
+        return majority_actions
     else:
         print(f"Proposal {proposal_number} is rejected by the threshold of {threshold}.")
-        # Send 'rejected' message to all nodes
-        # broadcast_verification_message(proposal_number, "rejected", node_id)
+        decide_no_op(node_id, proposer_id, proposal_number, slot)
+        return []
 
-def send_learn_message(proposer_id, proposal_number, action, node_id, malicious_nodes):
+def decide_no_op(node_id, proposer_id, proposal_number, slot):
+    """
+    Commit an empty batch for an instance the verifiers rejected, so later
+    slots are applied right away instead of waiting for the gap check, and
+    tell the proposer with a learn message carrying no actions.
+    """
+    if proposer_id is not None:
+        send_learn_message(proposer_id, proposal_number, slot, [], node_id, [])
+    commit_slot(node_id, slot, proposal_number, [])
+
+def send_learn_message(proposer_id, proposal_number, slot, actions, node_id, malicious_nodes):
     """
     Sends a 'learn' message to the proposer node with the result of the proposal.
     
@@ -466,7 +915,8 @@ def send_learn_message(proposer_id, proposal_number, action, node_id, malicious_
     learn_message = {
         "type": "learn",
         "proposal_number": proposal_number,
-        "action": action,
+        "slot": slot,
+        "actions": actions,
         "node_id": node_id,
         "malicious_nodes": malicious_nodes
     }
@@ -479,13 +929,127 @@ def send_learn_message(proposer_id, proposal_number, action, node_id, malicious_
     try:
         host = proposer_info['url'].split(":")[1].replace("/", "")
         port = 7000
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((host, port))
-            s.sendall(json.dumps(learn_message).encode())
-            print(f"Learn message sent to proposer {proposer_id}.")
+        peer_pool.send(proposer_id, host, port, learn_message)
+        print(f"Learn message sent to proposer {proposer_id}.")
     except (socket.error, json.JSONDecodeError) as e:
         print(f"Failed to send learn message to proposer {proposer_id}: {e}")
 
+def handle_learn_message(message, node_id, proposal_responses, stop_flag):
+    """
+    Handle one 'learn' message received on the learn listener.
+    The proposal is applied once the learners reach a quorum, or when its
+    10 second window closes if the quorum is never reached. Reports that
+    arrive after that still count for reputation, which is settled once
+    every expected learner reported or the window closed.
+    """
+    print(f"Received Learn message: {message}")
+
+    if message.get("type") == "learn":
+        proposal_number = message["proposal_number"]
+        slot = message.get("slot", 0)  # Nodes without stable leader support only use slot 0
+        instance = (proposal_number, slot)
+        node_id_received = message["node_id"]
+        actions = message_actions(message)
+        malicious_nodes = message["malicious_nodes"]
+        if not in_slot_window(slot):
+            print(f"Ignoring Learn from Node {node_id_received} for slot {slot}, outside the log window.")
+            return
+
+        with learn_lock:
+            if proposal_responses.is_settled(instance):
+                print(f"Ignoring late Learn from Node {node_id_received} for settled proposal {instance}.")
+                return
+
+            # Check if this is a new proposal instance that we haven't started a timer for yet
+            if instance not in stop_flag:
+                stop_flag[instance] = False
+                # Close the window after 10 seconds at the latest, nothing is polled
+                run_later(10, close_learn_window, node_id, instance, proposal_responses, stop_flag)
+
+            # Add the response to the list of responses for this proposal instance
+            responses = proposal_responses.add(instance, {
+                "node_id": node_id_received,
+                "actions": actions,
+                "malicious_nodes": malicious_nodes
+            })
+
+            # Apply as soon as enough learners agree instead of waiting for the timer
+            voters = expected_voters(node_id)
+            decide_now = quorum_reached(responses, voters) and proposal_responses.decide(instance)
+
+        if decide_now:
+            print(f"Quorum reached for learned proposal {proposal_number} (slot {slot}), applying now.")
+            proposal_responses.set_outcome(instance, apply_learned_proposal(node_id, instance, responses))
+        settle_learned(proposal_responses.settle(instance, voters))
+
+    else:
+        print(f"Received unexpected message type: {message.get('type')}")
+
+def apply_learned_proposal(node_id, instance, responses):
+    """
+    Apply a proposal once enough learners reported on it. The batch reported
+    by a majority of the learners is committed; an empty batch means the
+    verifiers rejected the proposal. Without a majority nothing is
+    committed, the slot stays open until the gap check resolves it.
+    Returns the committed batch, or None.
+    """
+    if not responses:
+        return []
+
+    # Collect the batch every learner reported for this proposal instance
+    batch_count = defaultdict(int)
+    for response in responses:
+        batch_count[json.dumps(response["actions"], sort_keys=True)] += 1
+    majority_key = max(batch_count, key=batch_count.get)
+
+    if batch_count[majority_key] * 2 <= len(responses):
+        print(f"Inconsistent actions for proposal {instance}: {[response['actions'] for response in responses]}, leaving slot {instance[1]} open.")
+        return None
+    if len(batch_count) > 1:
+        print(f"Inconsistent actions for proposal {instance}, following the majority of the learners.")
+
+    batch = json.loads(majority_key)
+    commit_slot(node_id, instance[1], instance[0], batch)
+    if not batch:
+        print(f"Proposal {instance[0]} (slot {instance[1]}) was decided as a no-op.")
+    return batch
+
+def settle_learned(settlement):
+    """
+    Adjust reputations once a learned instance is settled: learners that
+    reported the committed batch gain reputation, unless one of them flagged
+    them, and the nodes they flagged as malicious or that reported another
+    batch lose some. Instances committed as a no-op change no reputation.
+    """
+    if settlement is None:
+        return
+    responses, outcome = settlement
+    if not outcome:
+        return
+    malicious_nodes = set()
+    learners = set()
+    for response in responses:
+        if response["actions"] == outcome:
+            learners.add(str(response["node_id"]))
+            malicious_nodes.update(str(node) for node in response["malicious_nodes"])
+        else:
+            malicious_nodes.add(str(response["node_id"]))
+    print(f"Settled learned proposal with {len(responses)} reports, malicious nodes: {sorted(malicious_nodes)}")
+    update_reputations(learners - malicious_nodes, malicious_nodes)
+
+def close_learn_window(node_id, instance, proposal_responses, stop_flag):
+    """
+    Apply a learned proposal once its learn window has closed, unless a
+    quorum already applied it, and settle the reputation of its learners.
+    """
+    with learn_lock:
+        stop_flag.pop(instance, None)
+        decide_now = proposal_responses.decide(instance)
+    if decide_now:
+        proposal_responses.set_outcome(instance, apply_learned_proposal(node_id, instance, proposal_responses.responses(instance)))
+    proposal_responses.close(instance)
+    settle_learned(proposal_responses.settle(instance))
+
 def listen_for_learn_messages(node_id):
     """
     Function to listen for incoming 'learn' messages from other nodes.
@@ -500,101 +1064,150 @@ def listen_for_learn_messages(node_id):
     server_socket.listen(5)
     print(f"Node {node_id} listening for Learning on port {port}...")
 
-    # Set a timeout for accepting connections (non-blocking mode)
-    server_socket.settimeout(1.0)  # 1 second timeout
-
-    # Flags to stop listening after time expires {proposal_number: stop_flag}
+    # Windows still collecting votes {(proposal_number, slot): False}, closed by the timer service
     stop_flag = {}
 
-    proposal_responses = defaultdict(list)  # proposal_number -> list of {node_id, status}
+    proposal_responses = learn_votes  # (proposal_number, slot) -> list of {node_id, status}
 
     while True:  # Continue listening until time expires
         try:
-            # Try to accept a connection (this will not block for more than the set timeout)
             client_socket, addr = server_socket.accept()  # Accept incoming connection
-            print(f"Received Learn message from {addr}")
+            print(f"Received Learn connection from {addr}")
+
+            # Peers keep the connection open, serve its messages on a separate thread
+            threading.Thread(
+                target=serve_connection,
+                args=(client_socket, addr, handle_learn_message, node_id, proposal_responses, stop_flag),
+                daemon=True
+            ).start()
 
-            # Receive the message from the client
-            message_data = client_socket.recv(1024).decode()
-            try:
-                message = json.loads(message_data)
-                print(f"Received Learn message: {message}")
-
-                if message.get("type") == "learn":
-                    proposal_number = message["proposal_number"]
-                    node_id_received = message["node_id"]
-                    action = message["action"]
-                    malicious_nodes = message["malicious_nodes"]
-
-                    # Check if this is a new proposal number that we haven't started a timer for yet
-                    if proposal_number not in stop_flag:
-                        stop_flag[proposal_number] = False
-                        # Start a timer to stop listening after 10 seconds
-                        timer = threading.Thread(target=stop_listening, args=(stop_flag, proposal_number))
-                        timer.start()
-
-                    # Add the response to the list of responses for this proposal number
-                    proposal_responses[proposal_number].append({
-                        "node_id": node_id_received,
-                        "action": action
-                    })
-
-                else:
-                    print(f"Received unexpected message type: {message.get('type')}")
-
-            except json.JSONDecodeError:
-                print(f"Failed to decode broadcast message from {addr}. Ignoring.")
-            except Exception as e:
-                print(f"Error processing broadcast message from {addr}: {e}")
-
-            finally:
-                client_socket.close()
-
-        except socket.timeout:
-            # Timeout reached, check if any proposals have expired
-            expired_proposals = []  # Store expired proposals to delete after iteration
-            for proposal_number, stop_flag_value in stop_flag.items():
-                if stop_flag_value == False:
-                    continue
-                else:
-                    responses = proposal_responses[proposal_number]
-                    if responses:
-                        # Collect all actions for this proposal_number
-                        actions = [response["action"] for response in responses]
-
-                        # Check if all actions are the same
-                        if all(action == actions[0] for action in actions):
-                            action = actions[0]
-                            perform_action(action, BankingService(db_name=f"banking_node_{node_id}.db"))
-                            # Increase reputation for non-malicious nodes
-                            for node in active_nodes:
-                                if node not in malicious_nodes:
-                                    print(f"Reputation increased for Node {node}.")
-                                    increase_reputation(node)
-                                else:
-                                    print(f"Reputation decreased for Node {node}.")
-                                    decrease_reputation(node)
-                            print("Final list of active nodes: ", active_nodes)
-                        else:
-                            print(f"Inconsistent actions for proposal {proposal_number}: {actions}")
-
-                    expired_proposals.append(proposal_number)
-
-            # Remove expired proposals from stop_flag after the iteration
-            for proposal_number in expired_proposals:
-                del stop_flag[proposal_number]
         except Exception as e:
             print(f"Error accepting connection: {e}")
             continue
 
 
 
+def recover_acceptor_state(node_id):
+    """
+    Open the acceptor's write-ahead log and restore the promises and
+    accepted values it recorded before the node stopped.
+    """
+    global acceptor_wal, max_proposal
+    acceptor_wal = AcceptorWAL(f"banking_node_{node_id}.wal", acceptor_state_records, wal_checkpoint_interval)
+    records = acceptor_wal.recover()
+    with acceptor_lock:
+        for record in records:
+            max_proposal = max(max_proposal, record["proposal_number"])
+            if record["type"] == "accept":
+                accepted = accepted_slots.get(record["slot"])
+                if accepted is None or accepted[0] <= record["proposal_number"]:
+                    accepted_slots[record["slot"]] = (record["proposal_number"], record["actions"])
+    print(f"Recovered acceptor state: promised {max_proposal}, {len(accepted_slots)} accepted slots.")
+
+def acceptor_state_records():
+    """
+    Records that rebuild the current acceptor state, written when the WAL is
+    checkpointed. Accepted values of slots already applied are dropped.
+    """
+    with acceptor_lock:
+        with log_lock:
+            first_open_slot = next_apply_slot
+        for slot in [slot for slot in accepted_slots if slot < first_open_slot]:
+            del accepted_slots[slot]
+        records = [{"type": "promise", "proposal_number": max_proposal}]
+        for slot, (proposal_number, actions) in sorted(accepted_slots.items()):
+            records.append({"type": "accept", "proposal_number": proposal_number, "slot": slot, "actions": actions})
+    return records
+
+def handle_consensus_message(message, addr, node_id, db_name):
+    """
+    Handle one Paxos message received on the consensus listener and return the reply, if any.
+    """
+    global max_proposal
+    print(f"Received message: {message}")
+
+    response = None
+
+    if message.get("type") == "prepare":
+        print(f"Received Prepare message from {addr}: {message}")
+        # Handle Paxos Prepare messages
+        proposal_number = message["proposal_number"]
+        with acceptor_lock:
+            if proposal_number > max_proposal:
+                max_proposal = proposal_number
+                with log_lock:
+                    first_free_slot = max(highest_seen_slot + 1, next_apply_slot)
+                    first_open_slot = next_apply_slot
+                # The new proposer must propose these again, one of them may already be decided
+                accepted = [
+                    {"slot": slot, "proposal_number": accepted_proposal, "actions": actions}
+                    for slot, (accepted_proposal, actions) in sorted(accepted_slots.items())
+                    if slot >= first_open_slot
+                ]
+                response = {
+                    "status": "promise",
+                    "proposal_number": proposal_number,
+                    "next_slot": first_free_slot,
+                    "accepted": accepted
+                }
+                print(f"Promised proposal {proposal_number}")
+            else:
+                response = {"status": "reject", "proposal_number": proposal_number}
+                print(f"Rejected proposal {proposal_number} (already promised {max_proposal})")
+        if response["status"] == "promise":
+            # The promise must be on disk before the proposer can rely on it
+            acceptor_wal.append({"type": "promise", "proposal_number": proposal_number})
+    elif message.get("type") == "propose":
+        print(f"Received Propose message from {addr}: {message}")
+        # Handle Paxos Propose messages
+        proposal_number = message["proposal_number"]
+        slot = message.get("slot", 0)
+        proposer_id = message["proposer_id"]
+        actions = message_actions(message)
+        if not in_slot_window(slot):
+            print(f"Ignoring proposal {proposal_number} for slot {slot}, outside the log window.")
+            return None
+        # Slots are independent, so any slot under a ballot at least as high as the promised one is accepted
+        with acceptor_lock:
+            is_current = proposal_number >= max_proposal
+            if is_current:
+                max_proposal = proposal_number
+                accepted_slots[slot] = (proposal_number, actions)
+        if is_current:
+            note_slot(slot)
+            acceptor_wal.append({"type": "accept", "proposal_number": proposal_number, "slot": slot, "actions": actions})
+            # Validate on the validation pool so later messages on this connection are not held back
+            validation_pool.submit(validate_proposal, proposal_number, slot, actions, proposer_id, node_id, db_name)
+        else:
+            print(f"Rejected proposal {proposal_number} (not the highest)")
+            broadcast_verification_message(proposal_number, slot, "rejected", node_id,actions, proposer_id)
+
+    else:
+        # Handle other messages, such as checking feasibility of actions
+        response = check_if_possible(message, storage_engine)
+
+    return response
+
+def validate_proposal(proposal_number, slot, actions, proposer_id, node_id, db_name):
+    """
+    Check an accepted batch against the local database and broadcast the verdict.
+    """
+    is_possible = check_batch_if_possible(actions, storage_engine)
+    if node_id == 4:
+        is_possible = "rejected"
+    if is_possible == "approved":
+        print(f"Approved proposal {proposal_number} (slot {slot})")
+
+        broadcast_verification_message(proposal_number, slot, "approved", node_id,actions, proposer_id)
+    else:
+        print(f"Rejected proposal {proposal_number} (slot {slot}, not possible)")
+        broadcast_verification_message(proposal_number, slot, "rejected", node_id,actions, proposer_id)
+
 def listen_for_messages(node_id, db_name):
     """
     Function to listen for incoming connections from other nodes, handling actions and Paxos prepare messages.
     """
 
-    global max_proposal
     host = "0.0.0.0"  # Listen on all interfaces
     port = 5000
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -604,102 +1217,331 @@ def listen_for_messages(node_id, db_name):
     server_socket.listen(5)
     print(f"Node {node_id} listening on port {port}...")
 
-    # Track the highest prepare proposal number seen
-
     while True:
         client_socket, addr = server_socket.accept()  # Accept incoming connection
         print(f"Connection from {addr} received.")
 
-        # Receive the message from the client
-        message_data = client_socket.recv(1024).decode()
-        try:
-            message = json.loads(message_data)
-            print(f"Received message: {message}")
-
-            response = ""
-
-            if message.get("type") == "prepare":
-                print(f"Received Prepare message from {addr}: {message}")
-                # Handle Paxos Prepare messages
-                proposal_number = message["proposal_number"]
-                if proposal_number > max_proposal:
-                    max_proposal = proposal_number
-                    response = json.dumps({"status": "promise", "proposal_number": proposal_number})
-                    print(f"Promised proposal {proposal_number}")
-                else:
-                    response = json.dumps({"status": "reject", "proposal_number": proposal_number})
-                    print(f"Rejected proposal {proposal_number} (already promised {max_proposal})")
-            elif message.get("type") == "propose":
-                print(f"Received Propose message from {addr}: {message}")
-                # Handle Paxos Propose messages
-                proposal_number = message["proposal_number"]
-                proposer_id = message["proposer_id"]
-                if proposal_number == max_proposal:
-                    # Perform the action
-                    action = message["action"]
-                    banking_service = BankingService(db_name=db_name)
-                    is_possible = check_if_possible(action, banking_service)
-                    if node_id == 4:
-                        is_possible = "rejected"
-                    if is_possible == "approved":
-                        response = "approved"
-                        print(f"Approved proposal {proposal_number}")
-
-                        broadcast_verification_message(proposal_number, "approved", node_id,action, proposer_id)
-                    else:
-                        response = "rejected"
-                        print(f"Rejected proposal {proposal_number} (not possible)")
-                        broadcast_verification_message(proposal_number, "rejected", node_id,action, proposer_id)
-                else:
-                    response = "rejected"
-                    print(f"Rejected proposal {proposal_number} (not the highest)")
-                    broadcast_verification_message(proposal_number, "rejected", node_id,action, proposer_id)
+        # Peers keep the connection open, serve its messages on a separate thread
+        threading.Thread(
+            target=serve_connection,
+            args=(client_socket, addr, handle_consensus_message, addr, node_id, db_name),
+            daemon=True
+        ).start()
 
-            else:
-                # Handle other messages, such as checking feasibility of actions
-                banking_service = BankingService(db_name=db_name)
-                response = check_if_possible(message, banking_service)
+def recover_operation_log(node_id):
+    """
+    Open the node's operation log, rebuild the database from the last snapshot
+    and the slots logged after it, and resume the log at the next slot.
+    """
+    global operation_log
+    with log_lock:
+        operation_log = OperationLog(f"banking_node_{node_id}.db", snapshot_interval)
+        reload_from_operation_log(node_id)
+    print(f"Node {node_id} resumes the log at slot {next_apply_slot}.")
 
-            # Send the response back to the sender
-            client_socket.send(response.encode())
+def reload_from_operation_log(node_id):
+    """
+    Bring the database up to the end of the operation log and move
+    next_apply_slot past the logged slots. Called with log_lock held.
+    """
+    global next_apply_slot, highest_seen_slot
+    # The logged slots are replayed by the writer, like any decided slot
+    next_apply_slot = storage_engine.apply(replay_operation_log)
+    highest_seen_slot = max(highest_seen_slot, next_apply_slot - 1)
+
+    # Decisions and proposals already covered by the reloaded state are dropped
+    for slot in [slot for slot in decided_slots if slot < next_apply_slot]:
+        del decided_slots[slot]
+    for slot in [slot for slot in proposed_slots if slot < next_apply_slot]:
+        del proposed_slots[slot]
+    apply_decided_slots(node_id)
+
+def replay_operation_log(banking_service):
+    """
+    Replay the logged slots the database has not applied yet and return the
+    next slot to apply. The database is only restored from the snapshot when
+    the log does not continue from the slot it recorded, e.g. after a state
+    transfer; a snapshot taken by an older node is migrated to the current schema.
+    """
+    db_slot = operation_log.restore(banking_service.applied_slot())
+    banking_service.migrate()
+    banking_service.set_applied_slot(db_slot)
+    next_slot = operation_log.replay(lambda entry: perform_batch(entry["actions"], banking_service, entry["slot"]), db_slot)
+    # The whole database was replaced, so no cached balance can be trusted
+    storage_engine.clear_cache()
+    return next_slot
+
+def catch_up_from_peers(node_id):
+    """
+    Fetch the state of the peers that have applied more slots than this
+    node, most reputable first: a snapshot of their database plus the slots
+    they logged after that snapshot. A single peer could send a forged
+    state, so nothing is installed until the states of two peers agree up
+    to the last slot they have in common; only the slots up to that one are
+    installed. Returns True if the node's state was replaced.
+    """
+    peers = sorted(
+        (other_node_id for other_node_id in list(active_nodes) if str(other_node_id) != str(node_id)),
+        key=get_reputation,
+        reverse=True
+    )
+    fetched = []  # (node id, header, snapshot path) of every state received so far
+    try:
+        for other_node_id in peers:
+            node_info = active_nodes.get(other_node_id)
+            if node_info is None:
+                continue
+            host = node_info['url'].split(":")[1].replace("/", "")
+            with log_lock:
+                have_slot = next_apply_slot - 1
+            snapshot_path = f"{operation_log.snapshot_path}.transfer-{other_node_id}"
+            try:
+                header = fetch_state(host, state_transfer_port, have_slot, snapshot_path)
+            except (OSError, FrameError, ValueError) as e:
+                print(f"Could not fetch the state of Node {other_node_id}: {e}")
+                continue
 
-        except json.JSONDecodeError:
-            print(f"Failed to decode message from {addr}. Ignoring.")
-        except Exception as e:
-            print(f"Error processing message from {addr}: {e}")
+            if header is None:
+                # The peer may have just restarted itself, another one can still be ahead
+                print(f"Node {other_node_id} is not ahead of slot {have_slot}.")
+                continue
 
+            state = (other_node_id, header, snapshot_path)
+            fetched.append(state)
+            for other_state in fetched[:-1]:
+                agreed_slot = agreed_state_slot(other_state, state)
+                if agreed_slot is None:
+                    continue
+                with log_lock:
+                    # Slots applied while the snapshots were in transit may already cover them
+                    if agreed_slot < next_apply_slot:
+                        return False
+                    operation_log.install(other_state[2], [entry for entry in other_state[1]["entries"] if entry["slot"] <= agreed_slot])
+                    reload_from_operation_log(node_id)
+                print(f"Caught up with Nodes {other_state[0]} and {other_node_id}, resuming the log at slot {next_apply_slot}.")
+                return True
+
+        if fetched:
+            print(f"No two peers agree on the state of Nodes {[state[0] for state in fetched]}, not installing it.")
+        return False
+    finally:
+        for _, _, snapshot_path in fetched:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+def agreed_state_slot(first_state, second_state):
+    """
+    Compare the states received from two peers at the last slot both of
+    them reached. Returns that slot if they hold the same accounts there,
+    or None if they differ or have no slot in common this node still needs.
+    """
+    (first_node_id, first_header, first_path), (second_node_id, second_header, second_path) = first_state, second_state
+    slot = min(first_header["last_slot"], second_header["last_slot"])
+    with log_lock:
+        have_slot = next_apply_slot - 1
+    if slot <= have_slot or slot < max(first_header["snapshot_slot"], second_header["snapshot_slot"]):
+        return None
+
+    first_digest = state_digest(first_path, first_header, slot)
+    second_digest = state_digest(second_path, second_header, slot)
+    if first_digest is None or first_digest != second_digest:
+        print(f"The states of Nodes {first_node_id} and {second_node_id} differ at slot {slot}.")
+        return None
+    return slot
+
+def state_digest(snapshot_path, header, slot):
+    """
+    Replay the entries of a received state up to slot on a scratch copy of
+    its snapshot and return the digest of the resulting accounts, or None
+    if the entries do not reach slot without a gap.
+    """
+    check_path = snapshot_path + ".check"
+    shutil.copyfile(snapshot_path, check_path)
+    try:
+        banking_service = BankingService(check_path, synchronous="OFF")
+        try:
+            next_slot = header["snapshot_slot"] + 1
+            for entry in sorted(header["entries"], key=lambda entry: entry["slot"]):
+                if entry["slot"] < next_slot:
+                    continue
+                if entry["slot"] > slot or entry["slot"] != next_slot:
+                    break
+                perform_batch(entry["actions"], banking_service)
+                next_slot += 1
+            if next_slot != slot + 1:
+                return None
+            return banking_service.accounts_digest()
         finally:
-            client_socket.close()
+            banking_service.close()
+    finally:
+        for path in (check_path, check_path + "-wal", check_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+def listen_for_state_transfers(node_id):
+    """
+    Serve snapshots and the log tail to peers that join or fall behind.
+    Each transfer runs on its own thread and streams the snapshot file.
+    """
+    host = "0.0.0.0"
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind((host, state_transfer_port))
+    server_socket.listen(5)
+    print(f"Node {node_id} serving state transfers on port {state_transfer_port}...")
+
+    while True:
+        try:
+            client_socket, addr = server_socket.accept()
+            print(f"State transfer requested by {addr}")
+            threading.Thread(
+                target=serve_state_transfer,
+                args=(client_socket, addr, operation_log),
+                daemon=True
+            ).start()
+        except Exception as e:
+            print(f"Error accepting connection: {e}")
+            continue
+
+def run_later(delay, callback, *args):
+    """
+    Run a blocking callback after delay seconds, on the event loop's workers
+    when the node runs on it and on the shared timer service otherwise.
+    """
+    if runtime is not None:
+        runtime.call_later(delay, callback, *args)
+    else:
+        timer_service.schedule(delay, callback, *args)
+
+def in_slot_window(slot):
+    """
+    Check that a slot from a peer's message is at most max_in_flight_slots
+    past the next slot to apply. Messages are not authenticated, so a
+    single one must not be able to push the log arbitrarily far ahead.
+    """
+    if type(slot) is not int:
+        return False
+    with log_lock:
+        return slot < next_apply_slot + max_in_flight_slots
+
+def note_slot(slot):
+    """Remember the highest log slot proposed or accepted so new proposals are placed after it."""
+    global highest_seen_slot
+    with log_lock:
+        highest_seen_slot = max(highest_seen_slot, slot)
+
+def commit_slot(node_id, slot, proposal_number, actions):
+    """
+    Record the batch decided for a log slot and apply every decided batch
+    that is next in slot order. A decided slot is final: a later decision
+    for the same slot never replaces it, even under a higher proposal number.
+    """
+    with log_lock:
+        if slot < next_apply_slot:
+            print(f"Slot {slot} was already applied, ignoring proposal {proposal_number}.")
+            return
+        decided = decided_slots.get(slot)
+        if decided is not None:
+            print(f"Slot {slot} was already decided by proposal {decided[0]}, ignoring proposal {proposal_number}.")
+            return
+        decided_slots[slot] = (proposal_number, actions)
+        apply_decided_slots(node_id)
+        missing_slot = watch_log_gap()
+
+    if missing_slot is not None:
+        run_later(log_gap_timeout, fill_log_gap, node_id, missing_slot)
+
+def apply_decided_slots(node_id):
+    """
+    Apply the decided batches that are next in slot order, recording each one
+    in the operation log first. Called with log_lock held.
+    """
+    global next_apply_slot
+    while next_apply_slot in decided_slots:
+        proposal_number, actions = decided_slots.pop(next_apply_slot)
+        operation_log.append(next_apply_slot, proposal_number, actions)
+        # Empty batches are applied too, so the database records their slot
+        storage_engine.apply_actions(partial(perform_batch, slot=next_apply_slot), actions)
+        print(f"Applied slot {next_apply_slot} from proposal {proposal_number} ({len(actions)} actions).")
+        proposed_slots.pop(next_apply_slot, None)
+        next_apply_slot += 1
+
+    # Votes for applied slots are no longer needed, later ones are ignored
+    verification_votes.advance(next_apply_slot)
+    learn_votes.advance(next_apply_slot)
+
+    # The snapshot reads the database next to the writer, the apply path does not wait for it
+    if operation_log.should_snapshot():
+        run_later(0, operation_log.snapshot)
+
+def watch_log_gap():
+    """
+    Return the missing slot that holds back decided slots if no gap check is
+    scheduled for it yet. Called with log_lock held.
+    """
+    global gap_check_slot
+    if not decided_slots or gap_check_slot == next_apply_slot:
+        return None
+    print(f"Slots {sorted(decided_slots)} are waiting for slot {next_apply_slot}.")
+    gap_check_slot = next_apply_slot
+    return gap_check_slot
+
+def fill_log_gap(node_id, slot):
+    """
+    Resolve a slot that is still missing after log_gap_timeout seconds, so a
+    proposal that was never decided cannot stall the log forever. The slot
+    is never skipped locally, another replica may decide a batch for it:
+    the node first tries to catch up from peers that may have applied it,
+    and otherwise proposes a no-op for it through Paxos. Until the slot is
+    applied the check is repeated and the decided slots after it wait.
+    """
+    global gap_check_slot
+    with log_lock:
+        still_missing = next_apply_slot == slot and slot not in decided_slots
+    # A peer that already applied the slot can hand its state over
+    if still_missing and not catch_up_from_peers(node_id):
+        print(f"Slot {slot} was not decided within {log_gap_timeout} seconds.")
+        propose_no_op(node_id, slot)
+
+    with log_lock:
+        if gap_check_slot == slot:
+            gap_check_slot = None
+        missing_slot = watch_log_gap()
+
+    if missing_slot is not None:
+        run_later(log_gap_timeout, fill_log_gap, node_id, missing_slot)
 
 def increase_reputation(node_id):
     """Increase the reputation of a node."""
     global active_nodes
-    active_nodes[str(node_id)]['reputation'] += 10
-    print(f"Reputation increased for Node {node_id}. New reputation: {active_nodes[str(node_id)]['reputation']}")
-    registry_url = f"http://{registry_ip}:5000/reputation/increase"
-    try:
-        response = requests.post(registry_url, json={"node_id": str(node_id)})
-        if response.status_code == 200:
-            print(f"Reputation increased for Node {node_id}.")
-        else:
-            print(f"Failed to increase reputation for Node {node_id}. Error: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Error connecting to the registry: {e}")
+    node_info = active_nodes.get(str(node_id))
+    if node_info is None:
+        return  # The node left the cluster in the meantime
+    node_info['reputation'] += 10
+    print(f"Reputation increased for Node {node_id}. New reputation: {node_info['reputation']}")
+    reputation_aggregator.add(node_id, 10)
 
 def decrease_reputation(node_id):
     """Decrease the reputation of a node."""
     global active_nodes
-    active_nodes[str(node_id)]['reputation'] -= 20
-    print(f"Reputation decreased for Node {node_id}. New reputation: {active_nodes[str(node_id)]['reputation']}")
-    registry_url = f"http://{registry_ip}:5000/reputation/decrease"
-    try:
-        response = requests.post(registry_url, json={"node_id": node_id})
-        if response.status_code == 200:
-            print(f"Reputation decreased for Node {node_id}.")
-        else:
-            print(f"Failed to decrease reputation for Node {node_id}. Error: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Error connecting to the registry: {e}")
+    node_info = active_nodes.get(str(node_id))
+    if node_info is None:
+        return  # The node left the cluster in the meantime
+    node_info['reputation'] -= 20
+    print(f"Reputation decreased for Node {node_id}. New reputation: {node_info['reputation']}")
+    reputation_aggregator.add(node_id, -20)
+
+def send_reputation_updates(updates):
+    """
+    Send a batch of net reputation changes to the registry in one request.
+    Raises on failure so the aggregator keeps the changes for the next flush.
+    """
+    response = registry_client.update_reputations(updates)
+    if response.status_code != 200:
+        raise RuntimeError(f"Registry answered {response.status_code}: {response.text}")
+    unknown = response.json().get("unknown")
+    if unknown:
+        print(f"Registry skipped reputation updates for unregistered nodes {unknown}.")
+    print(f"Sent {len(updates)} reputation updates to the registry.")
 
 def perform_action(action, banking_service):
     """Perform the action on the local node using the shared banking service."""
@@ -737,27 +1579,112 @@ def perform_action(action, banking_service):
     except Exception as e:
         print(f"An error occurred while performing the action: {str(e)}")
 
+def perform_batch(actions, banking_service, slot=None):
+    """
+    Perform every action of a decided batch in order, in a single transaction
+    that also records the batch's log slot, if given, as the last one applied.
+    If the batch cannot be applied as a whole it is applied action by action;
+    the applied slot is unknown meanwhile, so a crash in between makes the
+    next restart restore the snapshot instead of applying the batch twice.
+    """
+    try:
+        applied = banking_service.apply_batch(actions, slot)
+        print(f"Applied {applied} of {len(actions)} actions in one transaction.")
+    except (KeyError, TypeError, AttributeError, sqlite3.Error) as e:
+        print(f"Batch could not be applied in one transaction ({e}), applying it action by action.")
+        if slot is not None:
+            banking_service.set_applied_slot(None)
+        for action in actions:
+            perform_action(action, banking_service)
+        if slot is not None:
+            banking_service.set_applied_slot(slot)
+
+def message_actions(message):
+    """
+    Get the batch of actions carried by a message. Nodes that do not batch
+    send a single 'action', which is treated as a batch of one.
+    """
+    if "actions" in message:
+        return message["actions"]
+    return [message["action"]]
+
+def simulate_processing_time():
+    """Sleep to simulate the processing time of a validation, as drawn from validation_latency."""
+    delay = validation_latency.sample()
+    print(f"Sleeping for {delay:.2f} seconds to simulate processing time...")
+    print("USING BANKING NODE V1")
+    time.sleep(delay)
+
 def check_if_possible(action, banking_service):
     """Check if the action is correct and possible to perform."""
-    print("Sleeping for 10 seconds to simulate processing time...")
-    print("USING BANKING NODE V1")
-    time.sleep(10)
-    if 'action' not in action:
+    simulate_processing_time()
+    return check_action(action, banking_service.get_balance)
+
+def check_batch_if_possible(actions, banking_service):
+    """
+    Check a batch action by action, in order, taking into account the
+    balances changed by earlier actions of the batch. A batch of well-formed
+    actions is approved even if some of them are not possible: those are
+    applied as no-ops, like apply_batch does, so the other actions of the
+    batch are not dropped with them. Malformed batches are rejected. An
+    empty batch is a no-op proposed for a log gap and is approved.
+    """
+    simulate_processing_time()
+    if not isinstance(actions, list):
+        return "rejected"
+    if not all(is_well_formed(action) for action in actions):
+        return "rejected"
+
+    balances = {}  # name -> balance after the earlier actions of the batch
+
+    def get_balance(name):
+        if name in balances:
+            return balances[name]
+        return banking_service.get_balance(name)
+
+    for action in actions:
+        if check_action(action, get_balance) != "approved":
+            print(f"Action {action} is not possible, it will be applied as a no-op.")
+            continue
+
+        name = action["name"]
+        if action["action"] == "create_account":
+            balances[name] = action["initial_balance"]
+        elif action["action"] == "deposit":
+            balances[name] = get_balance(name) + action["amount"]
+        elif action["action"] == "withdraw":
+            balances[name] = get_balance(name) - action["amount"]
+    return "approved"
+
+def is_well_formed(action):
+    """Check that an action has a known type and the fields that type needs."""
+    if not isinstance(action, dict) or not isinstance(action.get("name"), str):
+        return False
+    amount_field = {"deposit": "amount", "withdraw": "amount", "create_account": "initial_balance"}.get(action.get("action"))
+    if amount_field is None:
+        return False
+    amount = action.get(amount_field)
+    return isinstance(amount, (int, float)) and not isinstance(amount, bool)
+
+def check_action(action, get_balance):
+    """Check a single action against the balances returned by get_balance."""
+    if not isinstance(action, dict) or 'action' not in action:
         return "rejected"
     action_type = action['action']
     try:
         if action_type == "deposit":
             if 'name' in action and 'amount' in action:
-                balance = banking_service.get_balance(action["name"])
+                balance = get_balance(action["name"])
                 if balance is not None:
                     return "approved"
         elif action_type == "withdraw":
             if 'name' in action and 'amount' in action:
-                balance = banking_service.get_balance(action["name"])
+                balance = get_balance(action["name"])
                 if balance is not None and balance >= action["amount"]:
                     return "approved"
         elif action_type == "create_account":
-            if 'name' in action and 'initial_balance' in action:
+            # Account names are unique
+            if 'name' in action and 'initial_balance' in action and get_balance(action["name"]) is None:
                 return "approved"
         else:
             return "rejected"
@@ -773,14 +1700,14 @@ def register_with_registry(node_id):
     """
     global active_nodes
 
-    registry_url = f"http://{registry_ip}:5000/register"  # Adjust URL as needed
     node_url = f"http://{node_ip}:{5000}"
     
     try:
-        response = requests.post(registry_url, json={"node_id": node_id, "node_url": node_url})
+        response = registry_client.register(node_id, node_url, SUPPORTED_CODECS)
         if response.status_code == 201:
             print(f"Node {node_id} registered successfully with the registry.")
             active_nodes = get_nodes()
+            use_peer_codecs(active_nodes)
             #send registration to active nodes
             if len(active_nodes) > 0:
                 send_registration_to_active_nodes(active_nodes, node_id, node_url)
@@ -790,6 +1717,7 @@ def register_with_registry(node_id):
         elif response.status_code == 200:
             print(f"Node {node_id} already registered with the registry.")
             active_nodes = get_nodes()
+            use_peer_codecs(active_nodes)
             if len(active_nodes) > 0:
                 send_registration_to_active_nodes(active_nodes, node_id, node_url)
                 reputation = get_reputation_from_registry(node_id)
@@ -808,46 +1736,80 @@ def get_reputation_from_registry(node_id):
     """
     Get the reputation of the current node from the registry.
     """
-    registry_url = f"http://{registry_ip}:5000/reputation/{node_id}"  # Use path for node_id
     try:
-        response = requests.get(registry_url)  # No need for params, as node_id is part of the URL
-        if response.status_code == 200:
-            return response.json().get("reputation", 0)
-        else:
-            print(f"Failed to get reputation for Node {node_id}. Error: {response.text}")
-            return 0
+        return registry_client.reputation(node_id)
+    except requests.exceptions.HTTPError as e:
+        print(f"Failed to get reputation for Node {node_id}. Error: {e.response.text}")
+        return 0
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to the registry: {e}")
         return 0
 
+def use_peer_codecs(nodes):
+    """
+    Pick the wire codec for every known node from the codecs it advertised to the registry.
+    """
+    for other_node_id, node_info in list(nodes.items()):
+        peer_pool.set_codec(other_node_id, negotiate_codec(node_info.get("codecs")))
+
 def send_registration_to_active_nodes(active_nodes, node_id, node_ip):
     """
     Sends the registration information to all active nodes via socket communication.
     """
-    for node in active_nodes:
+    for node, node_info in list(active_nodes.items()):
         if str(node) != str(node_id):
             print(f"Adding Node {node} to the registry...")
-            node_url = active_nodes[node]['url']
+            node_url = node_info['url']
             if node_url:
                 try:
                     # Extract IP and port from the node URL
                     node_ip_send= node_url.replace("http://", "").split(":")[0]
                     node_port_send = 5001
 
-                    # Create a socket connection to the target node
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                        client_socket.connect((node_ip_send, node_port_send))
-                        registration_data = {
-                            node_id: {
-                                "url": f"{node_ip}",
-                                "reputation": 100
-                            }
+                    registration_data = {
+                        node_id: {
+                            "url": f"{node_ip}",
+                            "reputation": 100,
+                            "codecs": SUPPORTED_CODECS
                         }
-                        client_socket.send(json.dumps(registration_data).encode())
-                        print(f"Sent registration data to Node {node}.")
+                    }
+                    # Send over the pooled connection and wait for the acknowledgment
+                    response = peer_pool.request(node, node_ip_send, node_port_send, registration_data)
+                    print(f"Sent registration data to Node {node}: {response.get('status')}")
                 except Exception as e:
                     print(f"Error sending registration to node {node}: {e}")
 
+def handle_registration_message(registration_info):
+    """
+    Handle one registration announcement and return the acknowledgment for the sender.
+    """
+    try:
+        print(f"Received registration data: {registration_info}")
+
+        # Process the registration
+        for node_id, node_details in registration_info.items():
+            if "url" in node_details and "reputation" in node_details:
+                # A re-registered node is a new process, drop connections to the old one
+                peer_pool.forget(node_id)
+                active_nodes[node_id] = {
+                    "url": node_details["url"],
+                    "reputation": node_details["reputation"],
+                    "codecs": node_details.get("codecs", [])
+                }
+                # Nodes that advertise no codecs are older versions that only speak JSON
+                peer_pool.set_codec(node_id, negotiate_codec(node_details.get("codecs")))
+                print(f"Node {node_id} registered with URL {node_details['url']} and reputation {node_details['reputation']}.")
+            else:
+                print(f"Invalid registration data received: {node_details}")
+
+        # Send acknowledgment to the client (node)
+        return {"status": "success", "message": "Node registration processed successfully."}
+    except Exception as e:
+        print(f"Unexpected error processing registration: {e}")
+        return {"status": "error", "message": "An error occurred during registration."}
+    finally:
+        print("Active nodes: ", active_nodes)
+
 def listen_for_node_registrations():
     """Function to listen for new node registration requests."""
     host = "0.0.0.0"
@@ -863,58 +1825,83 @@ def listen_for_node_registrations():
         client_socket, addr = server_socket.accept()  # Accept incoming connection
         print(f"Registration request received from {addr}.")
 
+        # Peers keep the connection open, serve its messages on a separate thread
+        threading.Thread(
+            target=serve_connection,
+            args=(client_socket, addr, handle_registration_message),
+            daemon=True
+        ).start()
+
+def watch_membership(node_id):
+    """
+    Keep active_nodes in sync with the registry by long-polling its
+    membership changes. The first poll, and any poll the registry can no
+    longer answer with changes, returns the whole membership instead.
+    """
+    version = None
+    while True:
         try:
-            # Receive registration request data
-            registration_data = client_socket.recv(1024).decode()
-            registration_info = json.loads(registration_data)
-            print(f"Received registration data: {registration_info}")
-
-            # Process the registration
-            for node_id, node_details in registration_info.items():
-                if "url" in node_details and "reputation" in node_details:
-                    active_nodes[node_id] = {
-                        "url": node_details["url"],
-                        "reputation": node_details["reputation"]
-                    }
-                    print(f"Node {node_id} registered with URL {node_details['url']} and reputation {node_details['reputation']}.")
-                else:
-                    print(f"Invalid registration data received: {node_details}")
-
-            # Send acknowledgment to the client (node)
-            response = {"status": "success", "message": "Node registration processed successfully."}
-            client_socket.send(json.dumps(response).encode())
-        except json.JSONDecodeError as e:
-            print(f"Error decoding registration data: {e}")
-            response = {"status": "error", "message": "Invalid registration data format."}
-            client_socket.send(json.dumps(response).encode())
-        except Exception as e:
-            print(f"Unexpected error processing registration: {e}")
-            response = {"status": "error", "message": "An error occurred during registration."}
-            client_socket.send(json.dumps(response).encode())
-        finally:
-            print("Active nodes: ", active_nodes)
-            client_socket.close()
+            response = registry_client.watch(version, membership_watch_timeout)
+            if response.status_code != 200:
+                print(f"Failed to watch membership. Error: {response.text}")
+                time.sleep(membership_retry_delay)
+                continue
+            changes = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Error watching the registry membership: {e}")
+            time.sleep(membership_retry_delay)
+            continue
+
+        if changes.get("reset"):
+            apply_membership_snapshot(node_id, changes["nodes"])
+        else:
+            for event in changes["events"]:
+                apply_membership_event(node_id, event)
+        version = changes["version"]
+
+def apply_membership_snapshot(node_id, nodes):
+    """Replace active_nodes with the full membership sent by the registry."""
+    for other_node_id in [other_node_id for other_node_id in list(active_nodes) if other_node_id not in nodes]:
+        del active_nodes[other_node_id]
+    active_nodes.update(nodes)
+    registry_client.invalidate()
+    peer_pool.sync(active_nodes)
+    use_peer_codecs(active_nodes)
+    print(f"Membership reloaded from the registry: {sorted(active_nodes)}")
+
+def apply_membership_event(node_id, event):
+    """Apply one membership change sent by the registry to active_nodes."""
+    other_node_id = str(event["node_id"])
+    registry_client.invalidate(other_node_id)
+    if event["type"] == "deregister":
+        active_nodes.pop(other_node_id, None)
+        peer_pool.forget(other_node_id)
+        print(f"Node {other_node_id} left the cluster.")
+        return
+
+    if event["type"] == "register" and other_node_id != str(node_id):
+        # A newly registered node is a new process, drop connections to the old one
+        peer_pool.forget(other_node_id)
+    active_nodes[other_node_id] = event["node"]
+    # Nodes that advertise no codecs are older versions that only speak JSON
+    peer_pool.set_codec(other_node_id, negotiate_codec(event["node"].get("codecs")))
 
 def get_nodes():
     """
     Get the list of all nodes registered with the registry.
     """
-    registry_url = f"http://{registry_ip}:5000/nodes"
     try:
-        response = requests.get(registry_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to get nodes. Error: {response.text}")
-            return {}
+        return registry_client.nodes()
+    except requests.exceptions.HTTPError as e:
+        print(f"Failed to get nodes. Error: {e.response.text}")
+        return {}
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to the registry: {e}")
         return {}
  
 def unregister_node(node_id):
-    registry_url = f"http://{registry_ip}:5000/deregister"
     try:
-        response = requests.post(registry_url, json={"node_id": node_id})
+        response = registry_client.deregister(node_id)
         if response.status_code == 200:
             print(f"Node {node_id} unregistered successfully.")
         else:
@@ -924,16 +1911,51 @@ def unregister_node(node_id):
     
 def graceful_shutdown(node_id):
     print(f"Node {node_id} shutting down.")
+    # Send the pending reputation changes before leaving the registry
+    if reputation_aggregator is not None:
+        reputation_aggregator.close()
     unregister_node(node_id)
+    registry_client.close()
+    peer_pool.close_all()
+    if operation_log is not None:
+        operation_log.close()
+    if acceptor_wal is not None:
+        acceptor_wal.close()
+    if storage_engine is not None:
+        storage_engine.close()
 
 def start_banking_service(node_id):
+    global proposal_batcher, reputation_aggregator, storage_engine
     db_name = f"banking_node_{node_id}.db"
 
+    # Open the node's database once, every read and write goes through the storage engine
+    storage_engine = StorageEngine(
+        db_name, partial(BankingService, synchronous=db_synchronous), cache=AccountCache(account_cache_size)
+    )
+
+    # Rebuild the database and the acceptor state from their logs before taking part in consensus
+    recover_operation_log(node_id)
+    recover_acceptor_state(node_id)
+
     # Register the node with the registry
     register_with_registry(node_id)
 
     atexit.register(graceful_shutdown, node_id)
 
+    # Follow membership changes pushed by the registry
+    membership_thread = threading.Thread(target=watch_membership, args=(node_id,))
+    membership_thread.daemon = True
+    membership_thread.start()
+
+    # Batch reputation changes to the registry in the background
+    reputation_aggregator = ReputationAggregator(send_reputation_updates, reputation_flush_interval)
+
+    # Serve our state to other nodes and fetch the missing slots from the peers before joining consensus
+    state_thread = threading.Thread(target=listen_for_state_transfers, args=(node_id,))
+    state_thread.daemon = True
+    state_thread.start()
+    catch_up_from_peers(node_id)
+
     #Get total nodes
 
     # Start the listener thread for this node
@@ -956,14 +1978,83 @@ def start_banking_service(node_id):
     learn_thread.daemon = True
     learn_thread.start()
 
+    # Group menu actions into batches proposed in the background
+    proposal_batcher = ProposalBatcher(partial(propose_batch, node_id), batch_max_size, batch_max_delay)
+
+    # Proceed with the menu and banking operations
+    menu(node_id)
+
+def start_async_banking_service(node_id):
+    """
+    Start the node with one asyncio event loop serving all four listeners
+    instead of one blocking thread per socket.
+    """
+    global runtime, proposal_batcher, reputation_aggregator, storage_engine
+    db_name = f"banking_node_{node_id}.db"
+
+    # Open the node's database once, every read and write goes through the storage engine
+    storage_engine = StorageEngine(
+        db_name, partial(BankingService, synchronous=db_synchronous), cache=AccountCache(account_cache_size)
+    )
+
+    # Rebuild the database and the acceptor state from their logs before taking part in consensus
+    recover_operation_log(node_id)
+    recover_acceptor_state(node_id)
+
+    # Register the node with the registry
+    register_with_registry(node_id)
+
+    atexit.register(graceful_shutdown, node_id)
+
+    # Follow membership changes pushed by the registry
+    membership_thread = threading.Thread(target=watch_membership, args=(node_id,))
+    membership_thread.daemon = True
+    membership_thread.start()
+
+    # Batch reputation changes to the registry in the background
+    reputation_aggregator = ReputationAggregator(send_reputation_updates, reputation_flush_interval)
+
+    # Serve our state to other nodes and fetch the missing slots from the peers before joining consensus
+    state_thread = threading.Thread(target=listen_for_state_transfers, args=(node_id,))
+    state_thread.daemon = True
+    state_thread.start()
+    catch_up_from_peers(node_id)
+
+    runtime = AsyncNodeRuntime()
+    runtime.add_service(5000, handle_consensus_message, node_id, db_name, pass_peer_address=True)
+    runtime.add_service(5001, handle_registration_message)
+    runtime.add_service(6000, handle_broadcast_message, node_id, verification_votes, {})
+    runtime.add_service(7000, handle_learn_message, node_id, learn_votes, {})
+    runtime.start()
+
+    # Group menu actions into batches proposed in the background
+    proposal_batcher = ProposalBatcher(partial(propose_batch, node_id), batch_max_size, batch_max_delay)
+
     # Proceed with the menu and banking operations
     menu(node_id)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
+    # Pass --asyncio to serve every listener from a single event loop
+    use_asyncio = "--asyncio" in sys.argv[1:]
+    # Pass --stable-leader to keep a won ballot and skip Prepare for consecutive proposals
+    stable_leader_mode = "--stable-leader" in sys.argv[1:]
+    # Pass --validation-delay=MODEL to change the simulated validation time, e.g.
+    # --validation-delay=none, --validation-delay=uniform:0.5:2 or --validation-delay=exponential:1
+    for arg in sys.argv[1:]:
+        if arg.startswith("--validation-delay="):
+            validation_latency = parse_latency_model(arg.split("=", 1)[1])
+            print(f"Simulated validation time: {validation_latency}")
+    args = [
+        arg for arg in sys.argv[1:]
+        if arg not in ("--asyncio", "--stable-leader") and not arg.startswith("--validation-delay=")
+    ]
+    if len(args) != 1:
         node_id = int(input("Enter the node ID: "))
     else:
-        node_id = int(sys.argv[1])  # Get node ID from the command-line argument
+        node_id = int(args[0])  # Get node ID from the command-line argument
 
-    start_banking_service(node_id)
\ No newline at end of file
+    if use_asyncio:
+        start_async_banking_service(node_id)
+    else:
+        start_banking_service(node_id)
\ No newline at end of file
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+
+
+class AcceptorWAL:
+    """
+    Write-ahead log for acceptor promises and accepted values.
+    append() returns only once its record is on disk, but records are
+    group committed: one flusher thread writes every record queued while the
+    previous fsync was running and syncs them all at once, so concurrent
+    messages share a single fsync.
+    Every checkpoint_interval records the log is rewritten from
+    checkpoint_state(), which returns the records describing the current
+    acceptor state, so the file does not grow without bound.
+    """
+
+    def __init__(self, path, checkpoint_state, checkpoint_interval=10000):
+        self.path = path
+        self.checkpoint_state = checkpoint_state
+        self.checkpoint_interval = checkpoint_interval
+        self.pending = []  # Encoded records waiting for the next group commit
+        self.next_sequence = 0  # Sequence number of the next appended record
+        self.durable_sequence = 0  # Every record below this sequence number is on disk
+        self.records_since_checkpoint = 0
+        self.condition = threading.Condition()
+        self.file = None
+        self.thread = None
+        self.closed = False
+
+    def recover(self):
+        """
+        Read back every logged record, ignoring a torn last line, and open the
+        log for appending. Must be called before the first append().
+        """
+        records = []
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"Ignoring a torn record at the end of {self.path}.")
+                        break
+        # Rewrite the valid records so new ones never follow a torn line
+        self._rewrite(records)
+        self.records_since_checkpoint = len(records)
+        self.thread = threading.Thread(target=self._run, daemon=True, name="acceptor-wal")
+        self.thread.start()
+        return records
+
+    def append(self, record):
+        """Queue a record and wait until the group commit that includes it is synced."""
+        data = json.dumps(record).encode() + b"\n"
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The acceptor WAL is closed")
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            self.pending.append(data)
+            self.condition.notify_all()
+            while self.durable_sequence <= sequence and not self.closed:
+                self.condition.wait()
+
+    def _rewrite(self, records):
+        """Atomically replace the log with the given records and reopen it for appending."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(json.dumps(record).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if self.file is not None:
+            self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "ab")
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.pending:
+                    return
+                batch = self.pending
+                self.pending = []
+                batch_end = self.next_sequence
+
+            # Records queued during this write and fsync form the next group
+            self.file.write(b"".join(batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.records_since_checkpoint += len(batch)
+
+            with self.condition:
+                self.durable_sequence = batch_end
+                self.condition.notify_all()
+
+            if self.records_since_checkpoint >= self.checkpoint_interval:
+                # The state already reflects every record appended so far, including queued ones
+                records = self.checkpoint_state()
+                self._rewrite(records)
+                self.records_since_checkpoint = len(records)
+
+    def close(self):
+        """Flush the queued records and stop the flusher thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+MISSING = object()  # Returned by get() when the cache knows nothing about a name
+
+
+class AccountCache:
+    """
+    In-memory balances of recently used accounts, least recently used first
+    out beyond max_entries. Unknown names are cached too, as None, so
+    repeated lookups of accounts that do not exist stay in memory as well.
+    Only the apply path changes balances, and it writes its results through
+    with update(); every update bumps a generation so a read that raced with
+    it cannot put a stale balance back.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.balances = OrderedDict()  # name -> balance, or None for an unknown account
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """Return the cached balance (None for an unknown account), or MISSING."""
+        with self.lock:
+            balance = self.balances.get(name, MISSING)
+            if balance is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.balances.move_to_end(name)
+            return balance
+
+    def current_generation(self):
+        with self.lock:
+            return self.generation
+
+    def _put(self, name, balance):
+        self.balances[name] = balance
+        self.balances.move_to_end(name)
+        while len(self.balances) > self.max_entries:
+            self.balances.popitem(last=False)
+            self.evictions += 1
+
+    def fill(self, name, balance, generation):
+        """Cache a balance read from the database, unless an update happened since generation."""
+        with self.lock:
+            if self.generation == generation:
+                self._put(name, balance)
+
+    def update(self, balances):
+        """Write through the balances {name: balance or None} left by an applied batch."""
+        with self.lock:
+            self.generation += 1
+            for name, balance in balances.items():
+                self._put(name, balance)
+
+    def clear(self):
+        """Forget everything, e.g. after the database was restored from a snapshot."""
+        with self.lock:
+            self.generation += 1
+            self.balances.clear()
+
+    def stats(self):
+        """Hit and miss counters, for tuning max_entries."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.balances),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from codec import CodecError, decode_message, encode_message
+from framing import HEADER, MAX_FRAME_SIZE, FrameError, encode_frame
+
+
+class AsyncNodeRuntime:
+    """
+    Serves every listener of a node from a single asyncio event loop.
+    Message handlers stay ordinary blocking functions: they run on a shared
+    thread pool so SQLite and outgoing network work never stall the loop,
+    and timers are scheduled on the loop instead of being polled.
+    """
+
+    def __init__(self, host="0.0.0.0", max_workers=32):
+        self.host = host
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="node-worker")
+        self.services = []  # (port, handler, handler_args, pass_peer_address)
+        self.servers = []
+        self.writers = set()  # Open connections, closed on shutdown
+        self.ready = threading.Event()
+        self.startup_error = None
+        self.thread = None
+
+    def add_service(self, port, handle_message, *handler_args, pass_peer_address=False):
+        """
+        Register a listener. Each decoded message is passed to
+        handle_message(message, *handler_args), preceded by the peer address
+        when pass_peer_address is set; a non-None return value is the reply.
+        """
+        self.services.append((port, handle_message, handler_args, pass_peer_address))
+
+    def _run_blocking(self, callback, *args):
+        """Run a blocking callback on the worker pool and log its failure."""
+        future = self.loop.run_in_executor(self.executor, callback, *args)
+        future.add_done_callback(self._report_failure)
+        return future
+
+    def _report_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error in scheduled callback: {future.exception()}")
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedule a blocking callback to run on the worker pool after delay
+        seconds. Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, self._run_blocking, callback, *args)
+
+    async def _read_frame(self, reader):
+        try:
+            header = await reader.readexactly(HEADER.size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise FrameError("Connection closed in the middle of a frame")
+            return None
+        (length,) = HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise FrameError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+        try:
+            return await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise FrameError("Connection closed in the middle of a frame")
+
+    async def _serve_connection(self, reader, writer, handle_message, handler_args, pass_peer_address):
+        addr = writer.get_extra_info("peername")
+        print(f"Connection from {addr} received.")
+        self.writers.add(writer)
+        if pass_peer_address:
+            handler_args = (addr,) + handler_args
+        try:
+            while True:
+                frame = await self._read_frame(reader)
+                if frame is None:
+                    break
+                try:
+                    message = decode_message(frame)
+                except (CodecError, UnicodeDecodeError, json.JSONDecodeError):
+                    print(f"Failed to decode message from {addr}. Ignoring.")
+                    continue
+
+                try:
+                    response = await self.loop.run_in_executor(self.executor, handle_message, message, *handler_args)
+                except Exception as e:
+                    print(f"Error processing message from {addr}: {e}")
+                    continue
+
+                if response is not None:
+                    writer.write(encode_frame(encode_message(response)))
+                    await writer.drain()
+        except (OSError, FrameError) as e:
+            print(f"Connection from {addr} closed: {e}")
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _start_servers(self):
+        for port, handle_message, handler_args, pass_peer_address in self.services:
+            server = await asyncio.start_server(
+                lambda reader, writer, h=handle_message, a=handler_args, p=pass_peer_address:
+                    self._serve_connection(reader, writer, h, a, p),
+                self.host, port
+            )
+            self.servers.append(server)
+            print(f"Event loop listening on port {port}...")
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._start_servers())
+        except OSError as e:
+            self.startup_error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        """Start the event loop on a background thread and wait until every listener is bound."""
+        self.thread = threading.Thread(target=self._run, daemon=True, name="node-event-loop")
+        self.thread.start()
+        self.ready.wait()
+        if self.startup_error is not None:
+            raise self.startup_error
+
+    async def _shutdown(self):
+        for server in self.servers:
+            server.close()
+        # Close the open connections so their readers see EOF and finish
+        for writer in list(self.writers):
+            writer.close()
+        tasks = [task for task in asyncio.all_tasks(self.loop) if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1.0)
+        self.loop.stop()
+
+    def stop(self):
+        """Close the listeners and stop the event loop."""
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        if self.thread is not None:
+            self.thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from Banking_Node_v1 import BankingService, perform_action, perform_batch
+
+ACCOUNT_COUNT = 1000
+
+
+def sample_actions(count):
+    """Deposits and withdrawals spread over ACCOUNT_COUNT accounts, like a busy cluster decides them."""
+    return [
+        {"action": "deposit", "name": f"Account-{i % ACCOUNT_COUNT}", "amount": 25.0} if i % 3 else
+        {"action": "withdraw", "name": f"Account-{i % ACCOUNT_COUNT}", "amount": 10.0}
+        for i in range(count)
+    ]
+
+
+def open_service(tmp_dir, name, synchronous):
+    service = BankingService(os.path.join(tmp_dir, f"{name}.db"), synchronous=synchronous)
+    service.apply_batch([
+        {"action": "create_account", "name": f"Account-{i}", "initial_balance": 1000.0}
+        for i in range(ACCOUNT_COUNT)
+    ])
+    return service
+
+
+def run_benchmark(operations=1000000, batch_size=64, synchronous="NORMAL"):
+    actions = sample_actions(operations)
+    print(f"{operations} operations, WAL journal, synchronous={synchronous}")
+    print(f"{'mode':<24}{'seconds':>10}{'ops/s':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, "w") as devnull:
+        # One transaction per action, as every slot used to be applied
+        service = open_service(tmp_dir, "sequential", synchronous)
+        start = time.perf_counter()
+        with redirect_stdout(devnull):
+            for action in actions:
+                perform_action(action, service)
+        sequential_time = time.perf_counter() - start
+        service.close()
+        print(f"{'sequential':<24}{sequential_time:>10.2f}{operations / sequential_time:>12.0f}")
+
+        # One transaction per decided batch
+        service = open_service(tmp_dir, "batched", synchronous)
+        start = time.perf_counter()
+        with redirect_stdout(devnull):
+            for i in range(0, operations, batch_size):
+                perform_batch(actions[i:i + batch_size], service)
+        batched_time = time.perf_counter() - start
+        service.close()
+        print(f"{f'batched ({batch_size} per tx)':<24}{batched_time:>10.2f}{operations / batched_time:>12.0f}")
+        print(f"speedup: {sequential_time / batched_time:.1f}x")
+
+
+if __name__ == "__main__":
+    # Usage: python3 bench_apply.py [operations] [batch_size] [synchronous]
+    run_benchmark(
+        operations=int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+        batch_size=int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+        synchronous=sys.argv[3] if len(sys.argv) > 3 else "NORMAL"
+    )
@@ -0,0 +1,60 @@
+import sys
+import timeit
+
+from codec import BINARY_CODEC, JSON_CODEC, decode_message, encode_message
+
+# A batch of the size the proposal batcher produces under load
+sample_batch = [
+    {"action": "deposit", "name": f"Account-{i}", "amount": 250.0} if i % 2 else
+    {"action": "withdraw", "name": f"Account-{i}", "amount": 100.0}
+    for i in range(16)
+]
+
+# Representative consensus messages, shaped exactly like the ones the banking nodes send
+sample_messages = {
+    "prepare": {"type": "prepare", "proposal_number": 1042},
+    "propose": {
+        "type": "propose",
+        "proposal_number": 1042,
+        "slot": 7,
+        "actions": sample_batch,
+        "proposer_id": 1
+    },
+    "verify": {
+        "type": "verify",
+        "proposal_number": 1042,
+        "slot": 7,
+        "status": "approved",
+        "actions": sample_batch,
+        "node_id": 3,
+        "proposer_id": 1
+    },
+    "learn": {
+        "type": "learn",
+        "proposal_number": 1042,
+        "slot": 7,
+        "actions": sample_batch,
+        "node_id": 3,
+        "malicious_nodes": ["4"]
+    },
+}
+
+
+def time_per_call(function, number):
+    """Best-of-five time of one call, in microseconds."""
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def run_benchmark(number=20000):
+    print(f"{'message':<10}{'codec':<12}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, message in sample_messages.items():
+        for codec in (JSON_CODEC, BINARY_CODEC):
+            payload = encode_message(message, codec)
+            assert decode_message(payload) == message
+            encode_time = time_per_call(lambda: encode_message(message, codec), number)
+            decode_time = time_per_call(lambda: decode_message(payload), number)
+            print(f"{name:<10}{codec:<12}{len(payload):>8}{encode_time:>12.2f}{decode_time:>12.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import time
+
+import registry
+from codec import SUPPORTED_CODECS
+from registry_store import RegistryStore
+
+
+def populate(db_path, node_count):
+    """Write node_count registered nodes to a fresh registry database."""
+    store = RegistryStore(db_path)
+    store.save_all({
+        str(node_id): {
+            "url": f"http://10.0.{node_id // 256 % 256}.{node_id % 256}:5000",
+            "reputation": 100 - node_id % 50,
+            "codecs": SUPPORTED_CODECS
+        }
+        for node_id in range(1, node_count + 1)
+    })
+    store.close()
+
+
+def run_benchmark(node_count=10000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "registry.db")
+        populate(db_path, node_count)
+
+        # Time-to-serve: load the database, then answer the first membership request
+        start = time.perf_counter()
+        registry.load_registry(db_path)
+        loaded = time.perf_counter()
+        response = registry.app.test_client().get("/nodes")
+        served = time.perf_counter()
+        assert response.status_code == 200 and len(response.get_json()) == node_count
+
+        print(f"{'nodes':<10}{'load ms':>10}{'first /nodes ms':>18}{'time-to-serve ms':>19}")
+        print(f"{node_count:<10}{(loaded - start) * 1e3:>10.1f}{(served - loaded) * 1e3:>18.1f}{(served - start) * 1e3:>19.1f}")
+        registry.registry_store.close()
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
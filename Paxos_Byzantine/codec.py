@@ -0,0 +1,217 @@
+import json
+import struct
+
+# Codec names advertised to peers, in order of preference
+BINARY_CODEC = "binary-v3"
+JSON_CODEC = "json"
+SUPPORTED_CODECS = [BINARY_CODEC, JSON_CODEC]
+
+# Binary frames start with a byte that can never begin a UTF-8 JSON document
+MAGIC = 0xB1
+
+# magic, message type, status, flags, proposal number, slot, node id, proposer id
+HEADER = struct.Struct("!BBBBqqii")
+# action kind, amount, length of the account name in bytes
+ACTION = struct.Struct("!BdH")
+COUNT = struct.Struct("!H")
+NODE_ID = struct.Struct("!i")
+
+NO_NODE = -1
+HAS_ACTIONS = 0x01
+HAS_MALICIOUS_NODES = 0x02
+
+# type -> (code, fields carried besides "type" and "proposal_number")
+MESSAGE_LAYOUTS = {
+    "prepare": (1, frozenset()),
+    "propose": (2, frozenset({"slot", "actions", "proposer_id"})),
+    "verify": (3, frozenset({"slot", "status", "actions", "node_id", "proposer_id"})),
+    "learn": (4, frozenset({"slot", "actions", "node_id", "malicious_nodes"})),
+}
+MESSAGE_TYPES = {code: (name, fields) for name, (code, fields) in MESSAGE_LAYOUTS.items()}
+
+STATUS_CODES = {None: 0, "approved": 1, "rejected": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# action kind -> (code, name of its amount field)
+ACTION_LAYOUTS = {
+    "deposit": (1, "amount"),
+    "withdraw": (2, "amount"),
+    "create_account": (3, "initial_balance"),
+}
+ACTION_KINDS = {code: (kind, field) for kind, (code, field) in ACTION_LAYOUTS.items()}
+
+
+class CodecError(ValueError):
+    """Raised when a binary message cannot be decoded."""
+
+
+def negotiate_codec(peer_codecs):
+    """Pick the preferred codec that the peer also understands, defaulting to JSON."""
+    for codec in SUPPORTED_CODECS:
+        if codec in (peer_codecs or ()):
+            return codec
+    return JSON_CODEC
+
+
+def _is_node_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -2**31 < value < 2**31
+
+
+def _pack_action(action):
+    """Pack an action dict, or return None if it does not fit the fixed layout."""
+    if not isinstance(action, dict) or not isinstance(action.get("action"), str):
+        return None
+    layout = ACTION_LAYOUTS.get(action["action"])
+    if layout is None:
+        return None
+    code, amount_field = layout
+    if set(action) != {"action", "name", amount_field}:
+        return None
+    name, amount = action["name"], action[amount_field]
+    if not isinstance(name, str) or not isinstance(amount, float):
+        return None
+    name = name.encode()
+    if len(name) > 0xFFFF:
+        return None
+    return ACTION.pack(code, amount, len(name)) + name
+
+
+def _pack_actions(actions):
+    """Pack a batch of actions, or return None if any of them does not fit."""
+    if not isinstance(actions, list) or len(actions) > 0xFFFF:
+        return None
+    packed = [COUNT.pack(len(actions))]
+    for action in actions:
+        packed_action = _pack_action(action)
+        if packed_action is None:
+            return None
+        packed.append(packed_action)
+    return b"".join(packed)
+
+
+def _unpack_action(payload, offset):
+    """Unpack one action at offset and return it with the offset just past it."""
+    kind_code, amount, name_length = ACTION.unpack_from(payload, offset)
+    offset += ACTION.size
+    if kind_code not in ACTION_KINDS:
+        raise CodecError(f"Unknown binary action kind {kind_code}")
+    kind, amount_field = ACTION_KINDS[kind_code]
+    if offset + name_length > len(payload):
+        raise CodecError("Truncated account name")
+    account_name = bytes(payload[offset:offset + name_length]).decode()
+    return {"action": kind, "name": account_name, amount_field: amount}, offset + name_length
+
+
+def _pack_binary(message):
+    """Pack a consensus message, or return None if it has no binary layout."""
+    layout = MESSAGE_LAYOUTS.get(message.get("type"))
+    if layout is None:
+        return None
+    code, fields = layout
+    if set(message) != fields | {"type", "proposal_number"}:
+        return None
+
+    proposal_number = message["proposal_number"]
+    slot = message.get("slot", 0)
+    for number in (proposal_number, slot):
+        if not isinstance(number, int) or isinstance(number, bool) or not -2**63 <= number < 2**63:
+            return None
+
+    status = message.get("status")
+    if status not in STATUS_CODES:
+        return None
+    node_id = message.get("node_id", NO_NODE)
+    proposer_id = message.get("proposer_id", NO_NODE)
+    if not _is_node_id(node_id) or not _is_node_id(proposer_id):
+        return None
+
+    flags = 0
+    body = b""
+    if "actions" in fields:
+        packed_actions = _pack_actions(message["actions"])
+        if packed_actions is None:
+            return None
+        flags |= HAS_ACTIONS
+        body += packed_actions
+    if "malicious_nodes" in fields:
+        malicious_nodes = message["malicious_nodes"]
+        if not isinstance(malicious_nodes, list) or len(malicious_nodes) > 0xFFFF:
+            return None
+        ids = []
+        for malicious_node in malicious_nodes:
+            # Node ids travel as decimal strings, anything else keeps the JSON form
+            if not isinstance(malicious_node, str) or not malicious_node.isdigit() or str(int(malicious_node)) != malicious_node:
+                return None
+            if not _is_node_id(int(malicious_node)):
+                return None
+            ids.append(int(malicious_node))
+        flags |= HAS_MALICIOUS_NODES
+        body += COUNT.pack(len(ids)) + b"".join(NODE_ID.pack(i) for i in ids)
+
+    header = HEADER.pack(MAGIC, code, STATUS_CODES[status], flags, proposal_number, slot, node_id, proposer_id)
+    return header + body
+
+
+def _unpack_binary(payload):
+    try:
+        _, code, status, flags, proposal_number, slot, node_id, proposer_id = HEADER.unpack_from(payload, 0)
+    except struct.error as e:
+        raise CodecError(f"Truncated binary header: {e}")
+    if code not in MESSAGE_TYPES or status not in STATUS_NAMES:
+        raise CodecError(f"Unknown binary message type {code} or status {status}")
+    name, fields = MESSAGE_TYPES[code]
+    expected_flags = (HAS_ACTIONS if "actions" in fields else 0) | (HAS_MALICIOUS_NODES if "malicious_nodes" in fields else 0)
+    if flags != expected_flags:
+        raise CodecError(f"Unexpected flags {flags:#x} for binary {name} message")
+
+    message = {"type": name, "proposal_number": proposal_number}
+    if "slot" in fields:
+        message["slot"] = slot
+    if "status" in fields:
+        message["status"] = STATUS_NAMES[status]
+    if "node_id" in fields:
+        message["node_id"] = node_id
+    if "proposer_id" in fields:
+        message["proposer_id"] = proposer_id
+
+    offset = HEADER.size
+    try:
+        if flags & HAS_ACTIONS:
+            (count,) = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            actions = []
+            for _ in range(count):
+                action, offset = _unpack_action(payload, offset)
+                actions.append(action)
+            message["actions"] = actions
+        if flags & HAS_MALICIOUS_NODES:
+            (count,) = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            ids = struct.unpack_from(f"!{count}i", payload, offset)
+            offset += NODE_ID.size * count
+            message["malicious_nodes"] = [str(i) for i in ids]
+    except (struct.error, UnicodeDecodeError) as e:
+        raise CodecError(f"Truncated binary message: {e}")
+
+    if offset != len(payload):
+        raise CodecError("Trailing bytes after binary message")
+    return message
+
+
+def encode_message(message, codec=JSON_CODEC):
+    """
+    Encode a message with the given codec. Messages that have no binary
+    layout (replies, registrations, malformed actions) always fall back to JSON.
+    """
+    if codec == BINARY_CODEC:
+        packed = _pack_binary(message)
+        if packed is not None:
+            return packed
+    return json.dumps(message).encode()
+
+
+def decode_message(payload):
+    """Decode a message, detecting the codec from its first byte."""
+    if payload[:1] == bytes([MAGIC]):
+        return _unpack_binary(payload)
+    return json.loads(payload)
@@ -0,0 +1,108 @@
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+# Share of each request type in the load, roughly what a busy cluster sends
+request_mix = [
+    ("register", 0.05),
+    ("nodes", 0.30),
+    ("reputation", 0.30),
+    ("reputation/increase", 0.15),
+    ("reputation/decrease", 0.10),
+    ("reputation/batch", 0.10),
+]
+
+
+def percentile(latencies, fraction):
+    """Latency below which the given fraction of the requests completed."""
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def send_request(session, registry_url, kind, client_id, node_count):
+    node_id = str(random.randint(1, node_count))
+    if kind == "register":
+        node_id = f"load-{client_id}-{random.randint(1, 100)}"
+        return session.post(f"{registry_url}/register", json={"node_id": node_id, "node_url": f"http://10.1.0.{client_id % 256}:5000"})
+    if kind == "nodes":
+        return session.get(f"{registry_url}/nodes")
+    if kind == "reputation":
+        return session.get(f"{registry_url}/reputation/{node_id}")
+    if kind == "reputation/batch":
+        updates = [{"node_id": str(random.randint(1, node_count)), "delta": random.choice((10, -20))} for _ in range(8)]
+        return session.post(f"{registry_url}/reputation/batch", json={"updates": updates})
+    return session.post(f"{registry_url}/{kind}", json={"node_id": node_id})
+
+
+def run_client(client_id, registry_url, deadline, node_count, latencies, errors, lock):
+    """Send requests back to back over one keep-alive session until the deadline."""
+    session = requests.Session()
+    kinds = [kind for kind, _ in request_mix]
+    weights = [weight for _, weight in request_mix]
+    local_latencies = defaultdict(list)
+    local_errors = defaultdict(int)
+    while time.monotonic() < deadline:
+        kind = random.choices(kinds, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = send_request(session, registry_url, kind, client_id, node_count)
+            if response.status_code >= 500:
+                local_errors[kind] += 1
+        except requests.exceptions.RequestException:
+            local_errors[kind] += 1
+            continue
+        local_latencies[kind].append(time.perf_counter() - start)
+    with lock:
+        for kind, values in local_latencies.items():
+            latencies[kind].extend(values)
+        for kind, count in local_errors.items():
+            errors[kind] += count
+
+
+def run_load_test(clients=64, duration=10.0, registry_url="http://127.0.0.1:5000", node_count=100):
+    # Register the nodes whose reputation the clients read and update
+    session = requests.Session()
+    for node_id in range(1, node_count + 1):
+        session.post(f"{registry_url}/register", json={"node_id": node_id, "node_url": f"http://10.0.0.{node_id % 256}:{5000 + node_id}"})
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=run_client, args=(client_id, registry_url, deadline, node_count, latencies, errors, lock))
+        for client_id in range(clients)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    print(f"{clients} clients for {elapsed:.1f}s against {registry_url}")
+    print(f"{'endpoint':<22}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    all_latencies = []
+    for kind, _ in request_mix:
+        values = latencies[kind]
+        all_latencies.extend(values)
+        if not values:
+            continue
+        print(f"{kind:<22}{len(values):>10}{len(values) / elapsed:>10.0f}"
+              f"{percentile(values, 0.50) * 1e3:>10.2f}{percentile(values, 0.99) * 1e3:>10.2f}{errors[kind]:>8}")
+    if all_latencies:
+        print(f"{'total':<22}{len(all_latencies):>10}{len(all_latencies) / elapsed:>10.0f}"
+              f"{percentile(all_latencies, 0.50) * 1e3:>10.2f}{percentile(all_latencies, 0.99) * 1e3:>10.2f}{sum(errors.values()):>8}")
+
+
+if __name__ == "__main__":
+    # Usage: python3 load_test_registry.py [clients] [seconds] [registry_url]
+    run_load_test(
+        clients=int(sys.argv[1]) if len(sys.argv) > 1 else 64,
+        duration=float(sys.argv[2]) if len(sys.argv) > 2 else 10.0,
+        registry_url=sys.argv[3] if len(sys.argv) > 3 else "http://127.0.0.1:5000"
+    )
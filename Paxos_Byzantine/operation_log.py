@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+class OperationLog:
+    """
+    Append-only log of the slots a node decided, next to its banking database.
+    Every decided slot is appended and synced before it is applied, so the
+    database can always be rebuilt from the latest snapshot plus the log.
+    Snapshots are SQLite copies of the database taken every snapshot_interval
+    slots; the log prefix a snapshot covers is then dropped, which keeps the
+    disk usage and the restart replay bounded. The database records the last
+    slot applied to it (its applied_slot table), so snapshots can be taken
+    next to the writer and a restart only replays the log after that slot.
+    """
+
+    def __init__(self, db_name, snapshot_interval=1000, sync=True):
+        base = os.path.splitext(db_name)[0]
+        self.db_name = db_name
+        self.log_path = base + ".oplog"
+        self.snapshot_path = base + ".snapshot"
+        self.snapshot_interval = snapshot_interval
+        self.sync = sync
+        self.snapshot_slot = -1  # Last slot covered by the snapshot
+        self.last_slot = -1  # Last slot appended to the log
+        self.file = None
+        self.restore_pending = False  # A snapshot was installed but not restored to the database yet
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()  # Held while a snapshot is being taken
+
+    def _open(self):
+        self.file = open(self.log_path, "ab")
+
+    def _sync_file(self, f):
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+
+    def append(self, slot, proposal_number, actions):
+        """Durably record the batch decided for a slot."""
+        entry = {"slot": slot, "proposal_number": proposal_number, "actions": actions}
+        with self.lock:
+            if self.file is None:
+                self._open()
+            self.file.write(json.dumps(entry).encode() + b"\n")
+            self._sync_file(self.file)
+            self.last_slot = slot
+
+    def entries(self, after_slot=-1):
+        """
+        Read the logged entries for slots after after_slot, in log order.
+        A torn last line left by a crash in the middle of a write is skipped.
+        """
+        if not os.path.exists(self.log_path):
+            return []
+        entries = []
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Ignoring a torn entry at the end of {self.log_path}.")
+                    break
+                if entry["slot"] > after_slot:
+                    entries.append(entry)
+        return entries
+
+    def _read_snapshot_slot(self):
+        conn = sqlite3.connect(self.snapshot_path)
+        try:
+            return conn.execute("SELECT last_slot FROM snapshot_meta").fetchone()[0]
+        finally:
+            conn.close()
+
+    def should_snapshot(self):
+        """Check whether enough slots were appended since the last snapshot and none is being taken."""
+        return self.last_slot - self.snapshot_slot >= self.snapshot_interval and not self.snapshot_lock.locked()
+
+    def snapshot(self):
+        """
+        Copy the database into a new snapshot, then drop the log prefix it
+        covers. The copy is one read transaction on a connection of its own,
+        so with WAL it runs next to the writer instead of holding up the
+        slots being applied; it covers the slot the database recorded with
+        the last batch applied to it. Only one snapshot is taken at a time.
+        """
+        if not self.snapshot_lock.acquire(blocking=False):
+            return
+        try:
+            tmp_path = self.snapshot_path + ".tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            source = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target)
+                last_slot = target.execute("SELECT slot FROM applied_slot").fetchone()[0]
+                if last_slot is not None:
+                    with target:
+                        target.execute("CREATE TABLE snapshot_meta (last_slot INTEGER NOT NULL)")
+                        target.execute("INSERT INTO snapshot_meta (last_slot) VALUES (?)", (last_slot,))
+            finally:
+                target.close()
+                source.close()
+
+            with self.lock:
+                # A batch applied action by action leaves the slot unknown, and an installed snapshot may be newer
+                if last_slot is None or (os.path.exists(self.snapshot_path) and last_slot <= self.snapshot_slot):
+                    os.remove(tmp_path)
+                    return
+                with open(tmp_path, "rb") as f:
+                    if self.sync:
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+                self.snapshot_slot = last_slot
+                self._compact(self.entries(after_slot=last_slot))
+        finally:
+            self.snapshot_lock.release()
+        print(f"Snapshot taken at slot {last_slot}.")
+
+    def _compact(self, remaining):
+        """Rewrite the log with only the remaining entries. Called with the lock held."""
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in remaining:
+                f.write(json.dumps(entry).encode() + b"\n")
+            self._sync_file(f)
+        if self.file is not None:
+            self.file.close()
+        os.replace(tmp_path, self.log_path)
+        self._open()
+
+    def _restore_snapshot(self):
+        """Overwrite the database with the snapshot's copy of it."""
+        source = sqlite3.connect(self.snapshot_path)
+        target = sqlite3.connect(self.db_name)
+        try:
+            source.backup(target)
+            with target:
+                target.execute("DROP TABLE IF EXISTS snapshot_meta")
+        finally:
+            target.close()
+            source.close()
+
+    def _continues_from(self, db_slot):
+        """Check that the log holds every slot from the snapshot up to db_slot, without a gap."""
+        if db_slot < self.snapshot_slot:
+            return False
+        next_slot = self.snapshot_slot + 1
+        for entry in self.entries(after_slot=self.snapshot_slot):
+            if next_slot > db_slot or entry["slot"] != next_slot:
+                break
+            next_slot += 1
+        return next_slot > db_slot
+
+    def restore(self, db_slot):
+        """
+        Make sure the database is a state the log can be replayed on and
+        return the last slot it covers. db_slot is the last slot the database
+        recorded as applied, None if it is unknown. A database the log
+        continues from is kept as is, so a restart only replays the log
+        after it; otherwise, or after install(), the database is overwritten
+        with the snapshot. A node without a snapshot yet keeps its database
+        as is, at slot -1, and replay() takes a first snapshot of it.
+        """
+        if not os.path.exists(self.snapshot_path):
+            # Entries without a snapshot to replay them on cannot be trusted
+            with self.lock:
+                self._compact([])
+            self.snapshot_slot = self.last_slot = -1
+            return -1
+
+        self.snapshot_slot = self._read_snapshot_slot()
+        if not self.restore_pending and db_slot is not None and self._continues_from(db_slot):
+            return db_slot
+        self._restore_snapshot()
+        self.restore_pending = False
+        return self.snapshot_slot
+
+    def replay(self, apply_entry, db_slot):
+        """
+        Pass every entry logged after db_slot, the slot restore() returned,
+        in slot order, to apply_entry(entry) and return the next slot to
+        apply. Call it right after restore(), once the database records db_slot.
+        """
+        kept = []
+        replayed = 0
+        self.last_slot = self.snapshot_slot
+        for entry in self.entries(after_slot=self.snapshot_slot):
+            if entry["slot"] != self.last_slot + 1:
+                print(f"Operation log jumps from slot {self.last_slot} to {entry['slot']}, stopping the replay.")
+                break
+            if entry["slot"] > db_slot:
+                apply_entry(entry)
+                replayed += 1
+            kept.append(entry)
+            self.last_slot = entry["slot"]
+
+        # Drop anything after the contiguous prefix (a torn line or a gap) so new entries follow it
+        with self.lock:
+            self._compact(kept)
+        print(f"Recovered the database at slot {db_slot} (snapshot at slot {self.snapshot_slot}) and replayed {replayed} logged slots.")
+        if not os.path.exists(self.snapshot_path):
+            self.snapshot()
+        return self.last_slot + 1
+
+    def export_state(self):
+        """
+        Open the current snapshot together with the entries logged after it.
+        Returns (open snapshot file, snapshot slot, entries); the file stays
+        readable even if a newer snapshot replaces it, the caller closes it.
+        """
+        with self.lock:
+            return open(self.snapshot_path, "rb"), self.snapshot_slot, self.entries(after_slot=self.snapshot_slot)
+
+    def install(self, snapshot_path, entries):
+        """
+        Replace the snapshot and the log with state received from a peer.
+        Call restore() and replay() afterwards to rebuild the database from it;
+        restore() then always copies the new snapshot over the database.
+        """
+        with self.lock:
+            os.replace(snapshot_path, self.snapshot_path)
+            self.snapshot_slot = self._read_snapshot_slot()
+            self.last_slot = self.snapshot_slot
+            self._compact([entry for entry in entries if entry["slot"] > self.snapshot_slot])
+            self.restore_pending = True
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
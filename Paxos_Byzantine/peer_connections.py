@@ -0,0 +1,238 @@
+import json
+import select
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from codec import JSON_CODEC, CodecError, decode_message, encode_message
+from framing import FrameError, FrameReader, encode_frame, send_frame
+
+
+class MessageNotSent(ConnectionError):
+    """Raised when a connection fails before any byte of a message was written."""
+
+
+class PeerConnection:
+    """A long-lived TCP connection to one listener of a peer node."""
+
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        """Open the underlying socket."""
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader(self.sock)
+
+    def _is_stale(self):
+        """
+        Check whether the peer has closed the connection while it was idle.
+        An idle connection should never be readable, so any readable state
+        means either EOF or unexpected data and the socket must be replaced.
+        """
+        if self.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _close(self):
+        """Close the underlying socket, ignoring errors."""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+
+    def _exchange(self, data, expect_reply):
+        frame = encode_frame(data)
+        try:
+            if self._is_stale():
+                self._close()
+                self._connect()
+            written = self.sock.send(frame)
+        except OSError as e:
+            raise MessageNotSent(str(e)) from e
+        # Once part of the frame is out the peer may act on it, so errors from here on are not retried
+        if written < len(frame):
+            self.sock.sendall(frame[written:])
+        if not expect_reply:
+            return None
+        frame = self.reader.read()
+        if frame is None:
+            raise ConnectionResetError("Connection closed by peer before replying")
+        return decode_message(frame)
+
+    def send(self, message, expect_reply=False, codec=JSON_CODEC):
+        """
+        Send a message over the connection, reconnecting transparently.
+        A reused connection that turns out to be broken before the message
+        was written is retried once on a fresh socket. A failure after that,
+        e.g. while reading the reply, is raised to the caller: the peer may
+        already have handled the message, and messages such as Prepare must
+        not be handled twice.
+        """
+        data = encode_message(message, codec)
+        with self.lock:
+            reused = self.sock is not None
+            try:
+                return self._exchange(data, expect_reply)
+            except MessageNotSent:
+                self._close()
+                if not reused:
+                    raise
+            except (OSError, FrameError, ValueError):
+                self._close()
+                raise
+            try:
+                return self._exchange(data, expect_reply)
+            except (OSError, FrameError, ValueError):
+                self._close()
+                raise
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+class PeerConnectionPool:
+    """
+    Keeps one long-lived connection per (node id, port) so every message type
+    sent to a peer reuses the same TCP connection instead of a new handshake.
+    Asynchronous sends run on one worker per peer, so peers are contacted
+    concurrently while messages to the same peer keep their order.
+    Messages are encoded with the codec negotiated for each peer.
+    """
+
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self.connections = {}  # (node_id, port) -> PeerConnection
+        self.executors = {}  # node_id -> single-worker executor
+        self.codecs = {}  # node_id -> codec used when sending to it
+        self.lock = threading.Lock()
+
+    def _get(self, node_id, host, port):
+        key = (str(node_id), port)
+        with self.lock:
+            connection = self.connections.get(key)
+            if connection is None or connection.host != host:
+                # The node moved to a different address, drop the old socket
+                if connection is not None:
+                    connection.close()
+                connection = PeerConnection(host, port, timeout=self.timeout)
+                self.connections[key] = connection
+            return connection
+
+    def set_codec(self, node_id, codec):
+        """Set the codec used for messages sent to a peer."""
+        with self.lock:
+            self.codecs[str(node_id)] = codec
+
+    def send(self, node_id, host, port, message):
+        """Send a message to a peer without waiting for a reply."""
+        codec = self.codecs.get(str(node_id), JSON_CODEC)
+        self._get(node_id, host, port).send(message, codec=codec)
+
+    def request(self, node_id, host, port, message):
+        """Send a message to a peer and return its decoded reply."""
+        codec = self.codecs.get(str(node_id), JSON_CODEC)
+        return self._get(node_id, host, port).send(message, expect_reply=True, codec=codec)
+
+    def _submit(self, node_id, function, *args):
+        """
+        Queue a call on the worker of a peer. The worker is looked up and
+        the call submitted under the pool lock, so forget() cannot shut the
+        worker down in between; a worker that is shut down all the same is
+        reported like an unreachable peer, through the returned Future.
+        """
+        node_id = str(node_id)
+        with self.lock:
+            executor = self.executors.get(node_id)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"peer-{node_id}")
+                self.executors[node_id] = executor
+            try:
+                return executor.submit(function, node_id, *args)
+            except RuntimeError:
+                future = Future()
+                future.set_exception(ConnectionError(f"Node {node_id} was removed from the connection pool"))
+                return future
+
+    def send_async(self, node_id, host, port, message):
+        """Queue a message for a peer and return a Future for the send."""
+        return self._submit(node_id, self.send, host, port, message)
+
+    def request_async(self, node_id, host, port, message):
+        """Queue a request for a peer and return a Future for its reply."""
+        return self._submit(node_id, self.request, host, port, message)
+
+    def forget(self, node_id):
+        """Close every connection held for the given node."""
+        with self.lock:
+            keys = [key for key in self.connections if key[0] == str(node_id)]
+            connections = [self.connections.pop(key) for key in keys]
+            executor = self.executors.pop(str(node_id), None)
+            self.codecs.pop(str(node_id), None)
+            # Shut down under the lock, so no call is submitted to the worker after it stopped
+            if executor is not None:
+                executor.shutdown(wait=False)
+        for connection in connections:
+            connection.close()
+
+    def sync(self, active_nodes):
+        """Drop connections to nodes that are no longer active."""
+        with self.lock:
+            stale = {key[0] for key in self.connections if key[0] not in active_nodes}
+            stale.update(node_id for node_id in self.executors if node_id not in active_nodes)
+        for node_id in stale:
+            self.forget(node_id)
+
+    def close_all(self):
+        with self.lock:
+            connections = list(self.connections.values())
+            executors = list(self.executors.values())
+            self.connections.clear()
+            self.executors.clear()
+            self.codecs.clear()
+            for executor in executors:
+                executor.shutdown(wait=False)
+        for connection in connections:
+            connection.close()
+
+
+def serve_connection(client_socket, addr, handle_message, *handler_args):
+    """
+    Serve every message sent over one persistent connection.
+    Messages are length-prefixed frames in any supported codec; whatever the
+    handler returns (other than None) is written back as the reply frame.
+    """
+    reader = FrameReader(client_socket)
+    try:
+        for frame in reader:
+            try:
+                message = decode_message(frame)
+            except (CodecError, UnicodeDecodeError, json.JSONDecodeError):
+                print(f"Failed to decode message from {addr}. Ignoring.")
+                continue
+
+            try:
+                response = handle_message(message, *handler_args)
+            except Exception as e:
+                print(f"Error processing message from {addr}: {e}")
+                continue
+
+            if response is not None:
+                send_frame(client_socket, encode_message(response))
+    except (OSError, FrameError) as e:
+        print(f"Connection from {addr} closed: {e}")
+    finally:
+        client_socket.close()
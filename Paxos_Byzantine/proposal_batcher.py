@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class ProposalBatcher:
+    """
+    Accumulates banking actions and hands them to submit_batch in batches
+    bounded by max_batch_size and by max_delay seconds since the oldest
+    queued action. Batches are submitted in order from one background
+    thread, so actions keep accumulating while a batch is in consensus.
+    """
+
+    def __init__(self, submit_batch, max_batch_size=64, max_delay=0.05):
+        self.submit_batch = submit_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.pending = []
+        self.oldest = None  # time.monotonic() of the oldest pending action
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="proposal-batcher")
+        self.thread.start()
+
+    def add(self, action):
+        """Queue an action for the next batch."""
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The proposal batcher is closed")
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.append(action)
+            self.condition.notify()
+
+    def _next_batch(self):
+        """Wait until a batch is full or old enough and take it, or return None once closed and drained."""
+        with self.condition:
+            while True:
+                if self.pending:
+                    if len(self.pending) >= self.max_batch_size or self.closed:
+                        break
+                    remaining = self.oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                elif self.closed:
+                    return None
+                else:
+                    self.condition.wait()
+
+            batch = self.pending[:self.max_batch_size]
+            self.pending = self.pending[self.max_batch_size:]
+            self.oldest = time.monotonic() if self.pending else None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.submit_batch(batch)
+            except Exception as e:
+                print(f"Error proposing batch of {len(batch)} actions: {e}")
+
+    def close(self):
+        """Submit whatever is still pending and stop the background thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
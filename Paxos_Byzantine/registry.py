@@ -1,11 +1,63 @@
+import atexit
+import sys
+import threading
+from collections import deque
+
 from flask import Flask, request, jsonify
 
+from registry_store import RegistryStore
+
 app = Flask(__name__)
 
 # In-memory registry for storing node information and reputation
 node_registry = {}
 
+REGISTRY_DB = "registry.db"  # Nodes and reputations survive registry restarts in this database
+registry_store = None  # Opened by load_registry() before the registry starts serving
+
 DEFAULT_REPUTATION = 100  # Default reputation for newly registered nodes
+MAX_REPUTATION = 100
+
+# Requests are served from several threads, every read and update of node_registry holds this lock
+registry_lock = threading.Lock()
+
+# Every membership change bumps the version and is kept for watchers that are behind
+membership_version = 0
+membership_events = deque(maxlen=1000)  # Most recent changes, oldest first
+membership_changed = threading.Condition(registry_lock)
+MAX_WATCH_TIMEOUT = 60  # Longest a watch request may block, in seconds
+
+def load_registry(db_path=REGISTRY_DB):
+    """
+    Open the registry database and load every stored node into node_registry.
+    The membership version carries on from the stored one, so watchers that
+    were following the previous registry process get a full reload.
+    """
+    global registry_store, node_registry, membership_version
+    registry_store = RegistryStore(db_path)
+    node_registry, membership_version = registry_store.load()
+    atexit.register(registry_store.close)
+    print(f"Loaded {len(node_registry)} nodes from {db_path} at membership version {membership_version}.")
+
+def record_membership_change(change, node_id):
+    """
+    Bump the membership version, queue the node's new state for the
+    registry database and wake the watchers.
+    change is "register", "update" (reputation or codecs) or "deregister".
+    Called with registry_lock held, in the same critical section as the change.
+    """
+    global membership_version
+    node = node_registry.get(node_id)
+    membership_version += 1
+    if registry_store is not None:
+        registry_store.save(node_id, node if change != "deregister" else None, membership_version)
+    membership_events.append({
+        "version": membership_version,
+        "type": change,
+        "node_id": node_id,
+        "node": dict(node) if node is not None and change != "deregister" else None
+    })
+    membership_changed.notify_all()
 
 @app.route("/register", methods=["POST"])
 def register_node():
@@ -15,14 +67,26 @@ def register_node():
     data = request.json
     node_id = data.get("node_id")
     node_url = data.get("node_url")
+    codecs = data.get("codecs")  # Wire codecs the node understands, absent for older nodes
     node_id = str(node_id)
 
     if not node_id or not node_url:
         return jsonify({"error": "Node ID and URL are required"}), 400
 
+    with registry_lock:
+        return register_locked(node_id, node_url, codecs)
+
+def register_locked(node_id, node_url, codecs):
+    """Register a node or refresh an existing registration. Called with registry_lock held."""
     if node_id in node_registry:
         existing_node = node_registry[node_id]
         if existing_node["url"] == node_url:
+            # A restarted node may be running a different binary, keep its codecs current
+            if codecs is not None:
+                existing_node["codecs"] = codecs
+            else:
+                existing_node.pop("codecs", None)
+            record_membership_change("update", node_id)
             return jsonify({"message": f"Node {node_id} already registered with URL {node_url}"}), 200
         else:
             #Verificar se apenas muda a porta
@@ -38,6 +102,9 @@ def register_node():
         "url": node_url,
         "reputation": DEFAULT_REPUTATION
     }
+    if codecs is not None:
+        node_registry[node_id]["codecs"] = codecs
+    record_membership_change("register", node_id)
     return jsonify({"message": f"Node {node_id} registered successfully with URL {node_url}"}), 201
 
 @app.route("/nodes", methods=["GET"])
@@ -45,7 +112,34 @@ def list_nodes():
     """
     Endpoint to list all registered nodes with their reputation.
     """
-    return jsonify(node_registry), 200
+    with registry_lock:
+        nodes = {node_id: dict(node) for node_id, node in node_registry.items()}
+    return jsonify(nodes), 200
+
+@app.route("/nodes/watch", methods=["GET"])
+def watch_nodes():
+    """
+    Endpoint to follow membership changes.
+    Query parameters: since=<version> and timeout=<seconds>.
+    Blocks until the membership moves past 'since' or the timeout expires,
+    then returns { "version": <int>, "events": [...] } with the changes after
+    'since'. Without 'since', or when the changes after it are no longer
+    kept, returns { "version": <int>, "reset": true, "nodes": {...} } instead.
+    """
+    since = request.args.get("since", type=int)
+    timeout = min(request.args.get("timeout", 30, type=float), MAX_WATCH_TIMEOUT)
+
+    with membership_changed:
+        if since is not None and since == membership_version:
+            membership_changed.wait_for(lambda: membership_version != since, timeout)
+        version = membership_version
+        oldest = membership_events[0]["version"] if membership_events else version + 1
+        # A watcher ahead of us saw a previous registry process
+        if since is None or since > version or since < oldest - 1:
+            nodes = {node_id: dict(node) for node_id, node in node_registry.items()}
+            return jsonify({"version": version, "reset": True, "nodes": nodes}), 200
+        events = [event for event in membership_events if event["version"] > since]
+    return jsonify({"version": version, "events": events}), 200
 
 @app.route("/total_nodes", methods=["GET"])
 def total_nodes():
@@ -66,10 +160,12 @@ def deregister_node():
 
     node_id = data["node_id"]
     node_id = str(node_id)
-    if node_id not in node_registry:
-        return jsonify({"error": f"Node {node_id} is not registered."}), 404
+    with registry_lock:
+        if node_id not in node_registry:
+            return jsonify({"error": f"Node {node_id} is not registered."}), 404
 
-    del node_registry[node_id]
+        del node_registry[node_id]
+        record_membership_change("deregister", node_id)
     return jsonify({"message": f"Node {node_id} deregistered successfully."}), 200
 
 # Functions to manage reputation
@@ -85,18 +181,16 @@ def increase_reputation():
     amount = data.get("amount", 10)  # Default increase amount is 10
     node_id = str(node_id)
 
-    if not node_id or node_id not in node_registry:
-        return jsonify({"error": f"Node {node_id} is not registered."}), 404
+    with registry_lock:
+        if not node_id or node_id not in node_registry:
+            return jsonify({"error": f"Node {node_id} is not registered."}), 404
 
-    #Cant increase more than 100
-    if node_registry[node_id]["reputation"] + amount > 100:
-        node_registry[node_id]["reputation"] = 100
-        return jsonify({"message": f"Reputation for Node {node_id} increased by {amount}.", 
-                    "reputation": node_registry[node_id]["reputation"]}), 200
-    
-    node_registry[node_id]["reputation"] += amount
+        #Cant increase more than 100
+        reputation = min(node_registry[node_id]["reputation"] + amount, MAX_REPUTATION)
+        node_registry[node_id]["reputation"] = reputation
+        record_membership_change("update", node_id)
     return jsonify({"message": f"Reputation for Node {node_id} increased by {amount}.", 
-                    "reputation": node_registry[node_id]["reputation"]}), 200
+                    "reputation": reputation}), 200
 
 @app.route("/reputation/decrease", methods=["POST"])
 def decrease_reputation():
@@ -110,12 +204,50 @@ def decrease_reputation():
     amount = data.get("amount", 20)  # Default decrease amount is 10
     node_id = str(node_id)
 
-    if not node_id or node_id not in node_registry:
-        return jsonify({"error": f"Node {node_id} is not registered."}), 404
+    with registry_lock:
+        if not node_id or node_id not in node_registry:
+            return jsonify({"error": f"Node {node_id} is not registered."}), 404
 
-    node_registry[node_id]["reputation"] -= amount
+        node_registry[node_id]["reputation"] -= amount
+        reputation = node_registry[node_id]["reputation"]
+        record_membership_change("update", node_id)
     return jsonify({"message": f"Reputation for Node {node_id} decreased by {amount}.", 
-                    "reputation": node_registry[node_id]["reputation"]}), 200
+                    "reputation": reputation}), 200
+
+@app.route("/reputation/batch", methods=["POST"])
+def batch_reputation():
+    """
+    Endpoint to apply many reputation changes at once.
+    Expects JSON payload: { "updates": [{ "node_id": <str>, "delta": <int> }, ...] }
+    The batch is validated first and then applied atomically; updates for
+    nodes that are no longer registered are skipped and reported.
+    """
+    data = request.json
+    updates = data.get("updates") if data else None
+    if not isinstance(updates, list):
+        return jsonify({"error": "Invalid request. 'updates' must be a list."}), 400
+    for update in updates:
+        # bool is a subclass of int, but {"delta": true} is not a reputation change
+        if not isinstance(update, dict) or "node_id" not in update or type(update.get("delta")) is not int:
+            return jsonify({"error": f"Invalid update {update}. 'node_id' and an integer 'delta' are required."}), 400
+
+    reputations = {}
+    unknown = []
+    with registry_lock:
+        for update in updates:
+            node_id = str(update["node_id"])
+            if node_id not in node_registry:
+                unknown.append(node_id)
+                continue
+            node = node_registry[node_id]
+            # Same rule as /reputation/increase: reputation never goes above the maximum
+            node["reputation"] = min(node["reputation"] + update["delta"], MAX_REPUTATION)
+            reputations[node_id] = node["reputation"]
+            record_membership_change("update", node_id)
+
+    return jsonify({"message": f"Applied {len(reputations)} reputation updates.",
+                    "reputations": reputations,
+                    "unknown": unknown}), 200
 
 @app.route("/reputation/<node_id>", methods=["GET"])
 def get_reputation(node_id):
@@ -124,11 +256,34 @@ def get_reputation(node_id):
     """
     global node_registry
     node_id = str(node_id)
-    if node_id not in node_registry:
-        return jsonify({"error": f"Node {node_id} is not registered."}), 404
+    with registry_lock:
+        if node_id not in node_registry:
+            return jsonify({"error": f"Node {node_id} is not registered."}), 404
 
-    reputation = node_registry[node_id]["reputation"]
+        reputation = node_registry[node_id]["reputation"]
     return jsonify({"node_id": node_id, "reputation": reputation}), 200
 
+def serve_production(host="0.0.0.0", port=5000, threads=32):
+    """
+    Serve the registry from a multi-threaded production WSGI server.
+    Waitress is used when it is installed; otherwise the threaded Flask
+    server runs without the debugger and the reloader.
+    The registry state lives in this process, so it is served by threads
+    rather than by several worker processes.
+    """
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress is not installed, falling back to the threaded Flask server.")
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+    print(f"Serving the registry on {host}:{port} with {threads} threads.")
+    serve(app, host=host, port=port, threads=threads)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    load_registry()
+    # Pass --production to serve from a multi-threaded production server instead of the debug server
+    if "--production" in sys.argv[1:]:
+        serve_production()
+    else:
+        app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RegistryClient:
+    """
+    Client for the registry service over one keep-alive session, so calls
+    reuse pooled connections instead of opening a new one each time.
+    Every request has a timeout. Connection failures are retried with
+    backoff for every method; read and 5xx failures only for GETs, since a
+    repeated POST could apply a reputation change twice.
+    The membership and the reputations read from the registry are cached
+    for cache_ttl seconds, and the entries a local update touches are
+    invalidated right away.
+    """
+
+    def __init__(self, base_url, timeout=5.0, retries=3, backoff=0.2, cache_ttl=5.0, pool_size=8):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.nodes_cache = None  # (expiry, {node_id: node}) of the last membership read
+        self.reputation_cache = {}  # node_id -> (expiry, reputation)
+        self.lock = threading.Lock()
+
+    def _url(self, path):
+        return f"{self.base_url}/{path}"
+
+    def get(self, path, timeout=None, **kwargs):
+        return self.session.get(self._url(path), timeout=timeout or self.timeout, **kwargs)
+
+    def post(self, path, payload, timeout=None):
+        return self.session.post(self._url(path), json=payload, timeout=timeout or self.timeout)
+
+    def invalidate(self, node_id=None):
+        """Drop the cached reputation of a node, or the whole cache when node_id is None."""
+        with self.lock:
+            self.nodes_cache = None
+            if node_id is None:
+                self.reputation_cache.clear()
+            else:
+                self.reputation_cache.pop(str(node_id), None)
+
+    def nodes(self):
+        """Return the registered nodes, from the cache while it is fresh."""
+        with self.lock:
+            if self.nodes_cache is not None and self.nodes_cache[0] > time.monotonic():
+                return {node_id: dict(node) for node_id, node in self.nodes_cache[1].items()}
+        response = self.get("nodes")
+        response.raise_for_status()
+        nodes = response.json()
+        expiry = time.monotonic() + self.cache_ttl
+        with self.lock:
+            self.nodes_cache = (expiry, nodes)
+            for node_id, node in nodes.items():
+                self.reputation_cache[node_id] = (expiry, node["reputation"])
+        return {node_id: dict(node) for node_id, node in nodes.items()}
+
+    def reputation(self, node_id):
+        """Return the reputation of a node, from the cache while it is fresh."""
+        node_id = str(node_id)
+        with self.lock:
+            cached = self.reputation_cache.get(node_id)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+        response = self.get(f"reputation/{node_id}")
+        response.raise_for_status()
+        reputation = response.json().get("reputation", 0)
+        with self.lock:
+            self.reputation_cache[node_id] = (time.monotonic() + self.cache_ttl, reputation)
+        return reputation
+
+    def register(self, node_id, node_url, codecs):
+        """Register a node and return the registry's response."""
+        self.invalidate(node_id)
+        return self.post("register", {"node_id": node_id, "node_url": node_url, "codecs": codecs})
+
+    def deregister(self, node_id):
+        """Deregister a node and return the registry's response."""
+        self.invalidate(node_id)
+        return self.post("deregister", {"node_id": node_id})
+
+    def update_reputations(self, updates):
+        """Send a batch of reputation changes and return the registry's response."""
+        with self.lock:
+            self.nodes_cache = None
+            for update in updates:
+                self.reputation_cache.pop(str(update["node_id"]), None)
+        return self.post("reputation/batch", {"updates": updates})
+
+    def watch(self, since, timeout):
+        """Long-poll the membership changes after version since (None for the whole membership)."""
+        params = {"timeout": timeout}
+        if since is not None:
+            params["since"] = since
+        # The registry holds the request for up to timeout seconds before answering
+        return self.get("nodes/watch", timeout=timeout + 10, params=params)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+
+
+class RegistryStore:
+    """
+    SQLite copy of the registry, so a restarted registry keeps every node and
+    its reputation. The registry serves from its in-memory dict; changes are
+    queued with save() and written in one transaction per flush_interval by a
+    background thread, and the database runs in WAL mode so those batched
+    writes stay cheap.
+    """
+
+    def __init__(self, path="registry.db", flush_interval=0.1):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+        self.dirty = {}  # node_id -> node dict to write, or None to delete
+        self.version = None  # Membership version to write with the next flush
+        self.closed = False
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()  # Serializes transactions on the shared connection
+        self.thread = threading.Thread(target=self._run, daemon=True, name="registry-store")
+        self.thread.start()
+
+    def create_tables(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS nodes (
+                    node_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    reputation INTEGER NOT NULL,
+                    codecs TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS registry_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+
+    def load(self):
+        """Read every stored node. Returns (node_registry dict, membership version)."""
+        nodes = {}
+        with self.write_lock:
+            rows = self.conn.execute("SELECT node_id, url, reputation, codecs FROM nodes").fetchall()
+            row = self.conn.execute("SELECT value FROM registry_meta WHERE key = 'membership_version'").fetchone()
+        for node_id, url, reputation, codecs in rows:
+            node = {"url": url, "reputation": reputation}
+            if codecs is not None:
+                node["codecs"] = json.loads(codecs)
+            nodes[node_id] = node
+        return nodes, row[0] if row else 0
+
+    def save(self, node_id, node, version=None):
+        """Queue the current state of a node (None once it is deregistered) for the next flush."""
+        with self.condition:
+            self.dirty[node_id] = dict(node) if node is not None else None
+            if version is not None:
+                self.version = version
+
+    def save_all(self, nodes):
+        """Write many nodes in a single transaction right away, e.g. to import a registry."""
+        with self.write_lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO nodes (node_id, url, reputation, codecs) VALUES (?, ?, ?, ?)",
+                [self._row(node_id, node) for node_id, node in nodes.items()]
+            )
+
+    def _row(self, node_id, node):
+        codecs = node.get("codecs")
+        return node_id, node["url"], node["reputation"], json.dumps(codecs) if codecs is not None else None
+
+    def flush(self):
+        """
+        Write the queued changes in one transaction. Changes that fail to be
+        written are queued again, unless a newer change replaced them meanwhile.
+        """
+        with self.condition:
+            dirty, self.dirty = self.dirty, {}
+            version, self.version = self.version, None
+        if not dirty and version is None:
+            return
+        try:
+            with self.write_lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO nodes (node_id, url, reputation, codecs) VALUES (?, ?, ?, ?)",
+                    [self._row(node_id, node) for node_id, node in dirty.items() if node is not None]
+                )
+                self.conn.executemany(
+                    "DELETE FROM nodes WHERE node_id = ?",
+                    [(node_id,) for node_id, node in dirty.items() if node is None]
+                )
+                if version is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO registry_meta (key, value) VALUES ('membership_version', ?)",
+                        (version,)
+                    )
+        except sqlite3.Error:
+            with self.condition:
+                for node_id, node in dirty.items():
+                    self.dirty.setdefault(node_id, node)
+                if self.version is None:
+                    self.version = version
+            raise
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(self.flush_interval)
+                closed = self.closed
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error writing the registry to {self.path}: {e}")
+            if closed:
+                return
+
+    def close(self):
+        """Write whatever is still queued and close the database."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.conn.close()
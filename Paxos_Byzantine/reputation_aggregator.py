@@ -0,0 +1,65 @@
+import threading
+from collections import defaultdict
+
+
+class ReputationAggregator:
+    """
+    Accumulates reputation changes per node and hands the net deltas to
+    flush_updates([{"node_id": ..., "delta": ...}, ...]) from a background
+    thread every interval seconds, so deciding a proposal never waits for the
+    registry. If a flush raises, its deltas are merged back and retried with
+    the next one.
+    """
+
+    def __init__(self, flush_updates, interval=0.5):
+        self.flush_updates = flush_updates
+        self.interval = interval
+        self.deltas = defaultdict(int)  # node_id -> net reputation change not sent yet
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="reputation-aggregator")
+        self.thread.start()
+
+    def add(self, node_id, delta):
+        """Queue a reputation change for the next flush."""
+        with self.condition:
+            self.deltas[str(node_id)] += delta
+
+    def _take(self):
+        with self.condition:
+            deltas = self.deltas
+            self.deltas = defaultdict(int)
+        return deltas
+
+    def flush(self):
+        """Send the queued deltas now. Returns False if the flush failed."""
+        deltas = self._take()
+        updates = [{"node_id": node_id, "delta": delta} for node_id, delta in deltas.items() if delta]
+        if not updates:
+            return True
+        try:
+            self.flush_updates(updates)
+            return True
+        except Exception as e:
+            print(f"Error sending {len(updates)} reputation updates, retrying with the next flush: {e}")
+            with self.condition:
+                for node_id, delta in deltas.items():
+                    self.deltas[node_id] += delta
+            return False
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(self.interval)
+                closed = self.closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Send whatever is still queued and stop the background thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,90 @@
+import json
+import os
+import socket
+
+from framing import HEADER, MAX_FRAME_SIZE, RECV_BUFFER_SIZE, FrameError, send_frame
+
+STATE_REQUEST = "state_request"
+
+
+def recv_exactly(sock, size):
+    """Read exactly size bytes from the socket."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("Connection closed in the middle of a state transfer")
+        data += chunk
+    return bytes(data)
+
+
+def recv_message(sock):
+    """Read one length-prefixed JSON message."""
+    (length,) = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    return json.loads(recv_exactly(sock, length))
+
+
+def serve_state_transfer(client_socket, addr, operation_log):
+    """
+    Answer one state request. The reply is a JSON frame with the snapshot
+    slot, the snapshot size and the log entries after the snapshot, followed
+    by the raw snapshot file, sent with zero-copy sendfile where available.
+    """
+    try:
+        request = recv_message(client_socket)
+        if request.get("type") != STATE_REQUEST:
+            print(f"Unexpected state transfer request from {addr}: {request}")
+            return
+
+        snapshot_file, snapshot_slot, entries = operation_log.export_state()
+        with snapshot_file:
+            last_slot = entries[-1]["slot"] if entries else snapshot_slot
+            if last_slot <= request.get("have_slot", -1):
+                send_frame(client_socket, json.dumps({"status": "up_to_date", "last_slot": last_slot}).encode())
+                return
+
+            size = os.fstat(snapshot_file.fileno()).st_size
+            header = {
+                "status": "ok",
+                "snapshot_slot": snapshot_slot,
+                "last_slot": last_slot,
+                "size": size,
+                "entries": entries
+            }
+            send_frame(client_socket, json.dumps(header).encode())
+            client_socket.sendfile(snapshot_file, 0, size)
+        print(f"Sent the snapshot at slot {snapshot_slot} ({size} bytes) and {len(entries)} logged slots to {addr}.")
+    except (OSError, FrameError, ValueError) as e:
+        print(f"State transfer to {addr} failed: {e}")
+    finally:
+        client_socket.close()
+
+
+def fetch_state(host, port, have_slot, snapshot_path, timeout=30.0):
+    """
+    Ask a peer for its state if it has applied slots past have_slot.
+    The snapshot is streamed into snapshot_path in chunks and synced to disk.
+    Returns the reply header, whose "entries" are the slots logged after the
+    snapshot, or None when the peer is not ahead of this node.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        send_frame(sock, json.dumps({"type": STATE_REQUEST, "have_slot": have_slot}).encode())
+        header = recv_message(sock)
+        if header.get("status") != "ok":
+            return None
+
+        size = header["size"]
+        view = memoryview(bytearray(RECV_BUFFER_SIZE))
+        received = 0
+        with open(snapshot_path, "wb") as f:
+            while received < size:
+                count = sock.recv_into(view, min(len(view), size - received))
+                if not count:
+                    raise ConnectionResetError("Connection closed in the middle of the snapshot")
+                f.write(view[:count])
+                received += count
+            f.flush()
+            os.fsync(f.fileno())
+    return header
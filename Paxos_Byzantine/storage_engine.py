@@ -0,0 +1,100 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from account_cache import MISSING
+
+
+class StorageEngine:
+    """
+    The single owner of a node's banking database.
+    Writes are queued to one dedicated writer thread, which holds the only
+    writable connection and applies them in submission order. Reads borrow
+    a read-only connection from a pool, so validations and balance queries
+    never open a connection of their own and never wait behind the writer.
+    open_service(db_name, read_only) opens one connection-backed service.
+    With an AccountCache, balance reads are served from memory and the
+    batches applied through apply_actions() write their balances through.
+    """
+
+    def __init__(self, db_name, open_service, max_idle_readers=16, cache=None):
+        self.db_name = db_name
+        self.open_service = open_service
+        self.max_idle_readers = max_idle_readers
+        self.cache = cache
+        self.writer = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        self.readers = queue.LifoQueue()  # Idle read-only services
+        # The writer creates the schema, read-only connections need it to exist
+        self.executor.submit(self._open_writer).result()
+
+    def _open_writer(self):
+        self.writer = self.open_service(self.db_name, False)
+
+    def submit(self, apply, *args):
+        """Queue apply(*args, writer_service) on the writer thread and return its Future."""
+        return self.executor.submit(lambda: apply(*args, self.writer))
+
+    def apply(self, apply, *args):
+        """Run apply(*args, writer_service) on the writer thread and wait for its result."""
+        return self.submit(apply, *args).result()
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only service for the duration of a with block."""
+        try:
+            service = self.readers.get_nowait()
+        except queue.Empty:
+            service = self.open_service(self.db_name, True)
+        try:
+            yield service
+        finally:
+            if self.readers.qsize() < self.max_idle_readers:
+                self.readers.put(service)
+            else:
+                service.close()
+
+    def apply_actions(self, apply, actions):
+        """
+        Run apply(actions, writer_service) on the writer thread, then write
+        the balances of the accounts the actions touched through to the cache.
+        """
+        def apply_and_write_through(service):
+            result = apply(actions, service)
+            if self.cache is not None:
+                names = {action["name"] for action in actions if isinstance(action, dict) and "name" in action}
+                self.cache.update(service.get_balances(names))
+            return result
+        return self.apply(apply_and_write_through)
+
+    def clear_cache(self):
+        """Drop every cached balance, for when the database was replaced as a whole."""
+        if self.cache is not None:
+            self.cache.clear()
+
+    def get_balance(self, name):
+        """Read the balance of an account, from the cache or on a read-only connection."""
+        if self.cache is None:
+            with self.reader() as service:
+                return service.get_balance(name)
+
+        balance = self.cache.get(name)
+        if balance is not MISSING:
+            return balance
+        generation = self.cache.current_generation()
+        with self.reader() as service:
+            balance = service.get_balance(name)
+        self.cache.fill(name, balance, generation)
+        return balance
+
+    def close(self):
+        """Finish the queued writes and close every connection."""
+        if self.writer is not None:
+            self.executor.submit(self.writer.close).result()
+            self.writer = None
+        self.executor.shutdown(wait=True)
+        while True:
+            try:
+                self.readers.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,49 @@
+import unittest
+
+import registry
+
+
+class BatchReputationTest(unittest.TestCase):
+    """Tests for the /reputation/batch endpoint."""
+
+    def setUp(self):
+        registry.registry_store = None  # Keep the test off the registry database
+        registry.node_registry = {
+            "1": {"url": "http://127.0.0.1:5000", "reputation": 50},
+            "2": {"url": "http://127.0.0.2:5000", "reputation": 80},
+        }
+        self.client = registry.app.test_client()
+
+    def test_applies_updates_and_reports_unknown_nodes(self):
+        response = self.client.post("/reputation/batch", json={"updates": [
+            {"node_id": "1", "delta": 10},
+            {"node_id": 2, "delta": -20},
+            {"node_id": "3", "delta": 10},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["reputations"], {"1": 60, "2": 60})
+        self.assertEqual(response.get_json()["unknown"], ["3"])
+
+    def test_caps_reputation_at_the_maximum(self):
+        response = self.client.post("/reputation/batch", json={"updates": [{"node_id": "2", "delta": 50}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(registry.node_registry["2"]["reputation"], registry.MAX_REPUTATION)
+
+    def test_rejects_boolean_delta(self):
+        for delta in (True, False):
+            response = self.client.post("/reputation/batch", json={"updates": [{"node_id": "1", "delta": delta}]})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(registry.node_registry["1"]["reputation"], 50)
+
+    def test_rejects_the_whole_batch_if_one_update_is_invalid(self):
+        response = self.client.post("/reputation/batch", json={"updates": [
+            {"node_id": "1", "delta": 10},
+            {"node_id": "2", "delta": 1.5},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(registry.node_registry["1"]["reputation"], 50)
+        self.assertEqual(registry.node_registry["2"]["reputation"], 80)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TimerService:
+    """
+    Runs callbacks after a delay from one shared scheduler thread instead of
+    a sleeping thread per timeout. Deadlines are kept in a heap, so scheduling
+    costs O(log n); due callbacks are handed to a worker pool so a slow
+    callback never delays the deadlines behind it.
+    """
+
+    def __init__(self, max_workers=32):
+        self.max_workers = max_workers
+        self.heap = []  # (deadline, sequence, callback, args)
+        self.sequence = itertools.count()  # Keeps equal deadlines in scheduling order
+        self.condition = threading.Condition()
+        self.executor = None
+        self.thread = None
+        self.closed = False
+
+    def _start(self):
+        """Start the scheduler thread and the worker pool on first use. Called with the condition held."""
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="timer-worker")
+        self.thread = threading.Thread(target=self._run, daemon=True, name="timer-service")
+        self.thread.start()
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) on the worker pool after delay seconds. Safe to call from any thread."""
+        deadline = time.monotonic() + delay
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The timer service is closed")
+            if self.thread is None:
+                self._start()
+            entry = (deadline, next(self.sequence), callback, args)
+            heapq.heappush(self.heap, entry)
+            # Only a new earliest deadline changes how long the scheduler must sleep
+            if self.heap[0] is entry:
+                self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    remaining = self.heap[0][0] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.closed:
+                    return
+                _, _, callback, args = heapq.heappop(self.heap)
+            self.executor.submit(self._call, callback, args)
+
+    def _call(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error in timer callback {getattr(callback, '__name__', callback)}: {e}")
+
+    def pending(self):
+        """Number of callbacks still waiting for their deadline."""
+        with self.condition:
+            return len(self.heap)
+
+    def close(self):
+        """Drop the pending callbacks and stop the scheduler thread."""
+        with self.condition:
+            self.closed = True
+            self.heap.clear()
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.executor.shutdown(wait=False)
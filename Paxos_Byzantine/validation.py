@@ -0,0 +1,76 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LatencyModel:
+    """
+    Simulated processing time of one validation, in seconds.
+    kind is "fixed" (params: seconds), "uniform" (params: low, high),
+    "exponential" (params: mean) or "none" for no delay at all.
+    """
+
+    KINDS = {"none": 0, "fixed": 1, "uniform": 2, "exponential": 1}
+
+    def __init__(self, kind="fixed", *params):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency model '{kind}', expected one of {sorted(self.KINDS)}")
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"Latency model '{kind}' takes {self.KINDS[kind]} parameter(s), got {len(params)}")
+        if any(param < 0 for param in params):
+            raise ValueError("Latency model parameters must not be negative")
+        if kind == "uniform" and params[0] > params[1]:
+            raise ValueError("Uniform latency model needs low <= high")
+        self.kind = kind
+        self.params = params
+
+    def sample(self):
+        """Draw the processing time of one validation."""
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(*self.params)
+        if self.kind == "exponential":
+            mean = self.params[0]
+            return random.expovariate(1 / mean) if mean > 0 else 0.0
+        return 0.0
+
+    def __str__(self):
+        return ":".join([self.kind] + [str(param) for param in self.params])
+
+
+def parse_latency_model(spec):
+    """
+    Build a LatencyModel from "kind:param:...", e.g. "fixed:10", "uniform:0.5:2",
+    "exponential:1" or "none". A bare number is a fixed delay.
+    """
+    kind, *params = spec.split(":")
+    try:
+        if not params and kind not in LatencyModel.KINDS:
+            return LatencyModel("fixed", float(kind))
+        return LatencyModel(kind, *(float(param) for param in params))
+    except ValueError as e:
+        raise ValueError(f"Invalid latency model '{spec}': {e}")
+
+
+class ValidationPool:
+    """
+    Runs proposal validations on dedicated worker threads so the listener
+    that received the Propose keeps serving prepares and other proposals
+    while validations, and their simulated processing time, run in parallel.
+    """
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="validator")
+
+    def submit(self, validate, *args):
+        """Queue validate(*args) and return its Future; failures are logged."""
+        future = self.executor.submit(validate, *args)
+        future.add_done_callback(self._report_failure)
+        return future
+
+    def _report_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error validating proposal: {future.exception()}")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
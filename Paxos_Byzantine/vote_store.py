@@ -0,0 +1,136 @@
+import threading
+import time
+
+
+class VoteStore:
+    """
+    Votes collected per (proposal_number, slot) instance, and which instances
+    were already decided. An instance is decided as soon as its votes allow,
+    but its votes are kept until it is settled: once its window has closed
+    or every expected voter has voted, so votes that arrive after the
+    decision still count for reputation. Later votes are ignored.
+    Instances for slots below the low watermark (the next slot to apply) are
+    forgotten once settled, undecided ones right away, and instances older
+    than horizon seconds are evicted, so the store stays bounded however
+    long the node runs.
+    """
+
+    def __init__(self, horizon=300.0):
+        self.horizon = horizon
+        self.votes = {}  # instance -> list of votes
+        self.opened = {}  # instance -> time its first vote arrived, oldest first
+        self.decided = {}  # instance -> time it was decided, oldest first
+        self.outcomes = {}  # instance -> batch it was decided with, [] for a no-op
+        self.closed = set()  # Decided instances whose window has closed
+        self.settled = {}  # instance -> time it was settled, oldest first
+        self.low_watermark = 0  # Every slot below it has been applied
+        self.lock = threading.Lock()
+
+    def is_decided(self, instance):
+        """Check whether the instance was decided or its slot already applied."""
+        with self.lock:
+            return instance in self.decided or instance[1] < self.low_watermark
+
+    def is_settled(self, instance):
+        """Check whether the instance no longer takes votes."""
+        with self.lock:
+            return instance in self.settled or (instance[1] < self.low_watermark and instance not in self.votes)
+
+    def add(self, instance, vote):
+        """Add a vote and return the votes collected for the instance so far."""
+        with self.lock:
+            votes = self.votes.get(instance)
+            if votes is None:
+                self._collect_garbage()
+                votes = self.votes[instance] = []
+                self.opened[instance] = time.monotonic()
+            votes.append(vote)
+            return list(votes)
+
+    def responses(self, instance):
+        """Return the votes collected for the instance."""
+        with self.lock:
+            return list(self.votes.get(instance, []))
+
+    def decide(self, instance):
+        """
+        Mark the instance as decided. Returns False if it already was, so
+        only one caller goes on to handle the decision.
+        """
+        with self.lock:
+            if instance in self.decided or instance[1] < self.low_watermark:
+                return False
+            self.decided[instance] = time.monotonic()
+            return True
+
+    def set_outcome(self, instance, outcome):
+        """Record the batch a decided instance was decided with, [] for a no-op."""
+        with self.lock:
+            if instance in self.votes:
+                self.outcomes[instance] = outcome
+
+    def close(self, instance):
+        """Mark the window of the instance as closed, no voter is waited for any longer."""
+        with self.lock:
+            if instance in self.votes:
+                self.closed.add(instance)
+
+    def settle(self, instance, voters=None):
+        """
+        Settle a decided instance once its window closed or every one of
+        voters voted. Returns (votes, outcome) to the one caller that settles
+        it and drops the votes, or None if it cannot be settled yet.
+        """
+        with self.lock:
+            if instance in self.settled or instance not in self.outcomes:
+                return None
+            votes = self.votes[instance]
+            if instance not in self.closed:
+                voted = {str(vote["node_id"]) for vote in votes}
+                if voters is None or not {str(voter) for voter in voters} <= voted:
+                    return None
+            self.settled[instance] = time.monotonic()
+            outcome = self.outcomes.pop(instance)
+            self._forget(instance)
+            return votes, outcome
+
+    def _forget(self, instance):
+        """Drop the votes of an instance. Called with the lock held."""
+        self.votes.pop(instance, None)
+        self.opened.pop(instance, None)
+        self.outcomes.pop(instance, None)
+        self.closed.discard(instance)
+
+    def advance(self, low_watermark):
+        """
+        Forget the instances whose slot is below the new low watermark,
+        except decided ones that still wait to be settled.
+        """
+        with self.lock:
+            if low_watermark <= self.low_watermark:
+                return
+            self.low_watermark = low_watermark
+            for instance in [instance for instance in self.votes if instance[1] < low_watermark]:
+                if instance not in self.decided:
+                    self._forget(instance)
+            for table in (self.decided, self.settled):
+                for instance in [instance for instance in table if instance[1] < low_watermark]:
+                    if instance not in self.votes:
+                        del table[instance]
+
+    def _collect_garbage(self):
+        """Evict instances older than the horizon. Called with the lock held."""
+        expiry = time.monotonic() - self.horizon
+        # The tables are kept in insertion order, so the oldest instances come first
+        while self.opened:
+            instance, opened_at = next(iter(self.opened.items()))
+            if opened_at >= expiry:
+                break
+            self._forget(instance)
+        for table in (self.decided, self.settled):
+            while table and next(iter(table.values())) < expiry:
+                del table[next(iter(table))]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.votes) + len(self.decided) + len(self.settled)